@@ -1,35 +1,59 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import json
 import os
-from datetime import datetime, timedelta
-import pandas as pd
 from typing import Dict, List, Optional
+from indices import COLECCION_POR_CATEGORIA, categoria_de, etiqueta
+from componentes import HiloDatos, TreeviewVirtual
+from motor import CAMPOS_POR_TIPO_BUSQUEDA, COLECCIONES_INVENTARIO, DatosOcupados, ErrorPrestamo, MotorPrestamos
 
-class SistemaPrestamos:
+# Espera (ms) tras la última tecla antes de filtrar el autocompletado
+ESPERA_AUTOCOMPLETADO = 150
+
+# Cada cuánto (ms) se revisan los préstamos vencidos
+INTERVALO_VENCIMIENTOS = 60000
+
+# Cada cuánto (ms) se revisa si otra estación guardó cambios en la carpeta de datos
+INTERVALO_ARCHIVOS = 2000
+
+class SistemaPrestamos(MotorPrestamos):
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Gestión de Préstamos - Prepa 10")
         self.root.geometry("1200x800")
         self.root.configure(bg='#f0f0f0')
 
-        # Carpeta base del script
-        self.base_dir = os.path.dirname(os.path.abspath(__file__))
-
         # Configurar estilo
         self.setup_styles()
 
-        # Datos del sistema
-        self.prestamos = []
-        self.equipos = []
-        self.usuarios = []
-        self.prestamistas = []
+        # Vistas por refrescar en el siguiente turno del ciclo de eventos
+        self.vistas_pendientes = set()
+        self.refresco_programado = None
+
+        # Vistas cuyas pestañas ya se construyeron (las demás se crean al abrirlas)
+        self.vistas_construidas = {'prestamos', 'desplegables'}
+        self.pestanas_pendientes = {}
+
+        # Autocompletado pendiente de cada combo
+        self.autocompletado_programado = {}
 
-        # Cargar datos existentes
-        self.cargar_datos()
+        # Exportación en curso (se escribe en un hilo aparte)
+        self.exportacion = None
+
+        # Último error al leer los cambios de otras estaciones (se avisa una sola vez)
+        self.error_archivos = None
+
+        # Las operaciones que esperan al disco (candado, lectura, guardado) van en un hilo aparte
+        self.hilo_datos = HiloDatos(self.root)
+        self.cerrando = False
+        self.root.protocol("WM_DELETE_WINDOW", self.al_cerrar_ventana)
+
+        # Datos, índices y guardado: los datos viven en la carpeta del script
+        super().__init__(os.path.dirname(os.path.abspath(__file__)))
 
         # Crear interfaz
         self.crear_interfaz()
+        self.revisar_vencimientos()
+        self.vigilar_archivos()
         
     def setup_styles(self):
         """Configurar estilos para la interfaz"""
@@ -42,87 +66,81 @@ class SistemaPrestamos:
         style.configure('Custom.TButton', font=('Arial', 10, 'bold'))
         
     def cargar_datos(self):
-        """Cargar datos desde archivos JSON"""
+        """Cargar datos desde archivos JSON (o desde prestamos.db si existe)"""
         try:
-            # Helper para ruta absoluta
-            def ruta_json(nombre):
-                return os.path.join(self.base_dir, nombre)
+            super().cargar_datos()
+        except Exception as e:
+            # Los datos quedan sin cargar: se leen completos en cuanto la carpeta esté disponible
+            messagebox.showerror("Error", f"Error al cargar datos (se reintentará): {str(e)}")
 
-            # Cargar préstamos
-            if os.path.exists(ruta_json('prestamos.json')):
-                with open(ruta_json('prestamos.json'), 'r', encoding='utf-8') as f:
-                    self.prestamos = json.load(f)
-            else:
-                self.prestamos = []
+    def en_memoria(self, funcion, *args):
+        """Cambiar los datos en memoria siempre desde el hilo de Tk, que es el que los dibuja"""
+        return self.hilo_datos.en_hilo_tk(funcion, *args)
 
-            # Cargar equipos
-            if os.path.exists(ruta_json('equipos.json')):
-                with open(ruta_json('equipos.json'), 'r', encoding='utf-8') as f:
-                    self.equipos = json.load(f)
-            else:
-                self.equipos = []
+    def en_segundo_plano(self, operacion, al_terminar=None, mensaje_error="Error"):
+        """Ejecutar una operación del motor en el hilo de datos sin congelar la ventana
 
-            # Cargar controles
-            if os.path.exists(ruta_json('controles.json')):
-                with open(ruta_json('controles.json'), 'r', encoding='utf-8') as f:
-                    self.controles = json.load(f)
+        al_terminar recibe el resultado en el hilo de Tk; los errores se avisan con un mensaje.
+        """
+        def al_fallar(e):
+            if isinstance(e, ErrorPrestamo):
+                messagebox.showerror("Error", str(e))
             else:
-                self.controles = []
+                messagebox.showerror("Error", f"{mensaje_error}: {str(e)}")
 
-            # Cargar cables
-            if os.path.exists(ruta_json('cables.json')):
-                with open(ruta_json('cables.json'), 'r', encoding='utf-8') as f:
-                    self.cables = json.load(f)
-            else:
-                self.cables = []
+        self.hilo_datos.enviar(operacion, al_terminar or (lambda resultado: None), al_fallar)
 
-            # Cargar audifonos
-            if os.path.exists(ruta_json('audifonos.json')):
-                with open(ruta_json('audifonos.json'), 'r', encoding='utf-8') as f:
-                    self.audifonos = json.load(f)
-            else:
-                self.audifonos = []
+    def revisar_vencimientos(self):
+        """Marcar los préstamos que vencieron desde la última revisión"""
+        self.actualizar_vencidos()
+        self.root.after(INTERVALO_VENCIMIENTOS, self.revisar_vencimientos)
 
-            # Cargar usuarios
-            if os.path.exists(ruta_json('usuarios.json')):
-                with open(ruta_json('usuarios.json'), 'r', encoding='utf-8') as f:
-                    self.usuarios = json.load(f)
-            else:
-                self.usuarios = []
+    def vigilar_archivos(self):
+        """Recargar lo que guardaron otras estaciones; solo se refrescan las vistas afectadas"""
+        if self.cerrando:
+            return
+        # La revisión espera al candado y lee los archivos en el hilo de datos
+        self.hilo_datos.enviar(self.revisar_archivos, self.archivos_revisados, self.archivos_no_revisados)
 
-            # Cargar prestamistas
-            if os.path.exists(ruta_json('prestamistas.json')):
-                with open(ruta_json('prestamistas.json'), 'r', encoding='utf-8') as f:
-                    self.prestamistas = json.load(f)
-            else:
-                self.prestamistas = []
+    def archivos_revisados(self, cambiadas):
+        """Programar la siguiente revisión de archivos"""
+        self.error_archivos = None
+        if not self.cerrando:
+            self.root.after(INTERVALO_ARCHIVOS, self.vigilar_archivos)
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar datos: {str(e)}")
-    
-    def guardar_datos(self):
-        """Guardar datos en archivos JSON"""
-        try:
-            def ruta_json(nombre):
-                return os.path.join(self.base_dir, nombre)
+    def archivos_no_revisados(self, e):
+        """Avisar un error de la revisión de archivos y programar la siguiente"""
+        if isinstance(e, (DatosOcupados, OSError)):
+            # Carpeta compartida ocupada o no disponible por el momento: se reintenta en la siguiente revisión
+            pass
+        elif str(e) != self.error_archivos:
+            # Datos dañados o error del programa: avisar una vez, no en cada revisión
+            self.error_archivos = str(e)
+            messagebox.showerror("Error", f"Error al leer los cambios de otras estaciones: {str(e)}")
+        if not self.cerrando:
+            self.root.after(INTERVALO_ARCHIVOS, self.vigilar_archivos)
+
+    def programar_refresco(self, *vistas):
+        """Marcar vistas para refrescarlas una sola vez cuando Tk quede libre"""
+        self.vistas_pendientes.update(vistas)
+        if self.refresco_programado is None:
+            self.refresco_programado = self.root.after_idle(self.refrescar_vistas)
+
+    def refrescar_vistas(self):
+        """Refrescar cada vista marcada desde el último turno"""
+        self.refresco_programado = None
+        # Las pestañas sin construir se llenan completas al abrirlas
+        vistas = self.vistas_pendientes & self.vistas_construidas
+        self.vistas_pendientes = set()
+        if 'prestamos' in vistas:
+            self.actualizar_lista_prestamos()
+        if 'equipos' in vistas:
+            self.actualizar_lista_equipos()
+        if 'usuarios' in vistas:
+            self.actualizar_listas_usuarios()
+        if 'desplegables' in vistas:
+            self.actualizar_listas_desplegables()
 
-            with open(ruta_json('prestamos.json'), 'w', encoding='utf-8') as f:
-                json.dump(self.prestamos, f, ensure_ascii=False, indent=2)
-            with open(ruta_json('equipos.json'), 'w', encoding='utf-8') as f:
-                json.dump(self.equipos, f, ensure_ascii=False, indent=2)
-            with open(ruta_json('controles.json'), 'w', encoding='utf-8') as f:
-                json.dump(self.controles, f, ensure_ascii=False, indent=2)
-            with open(ruta_json('cables.json'), 'w', encoding='utf-8') as f:
-                json.dump(self.cables, f, ensure_ascii=False, indent=2)
-            with open(ruta_json('audifonos.json'), 'w', encoding='utf-8') as f:
-                json.dump(self.audifonos, f, ensure_ascii=False, indent=2)
-            with open(ruta_json('usuarios.json'), 'w', encoding='utf-8') as f:
-                json.dump(self.usuarios, f, ensure_ascii=False, indent=2)
-            with open(ruta_json('prestamistas.json'), 'w', encoding='utf-8') as f:
-                json.dump(self.prestamistas, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al guardar datos: {str(e)}")
-    
     def crear_interfaz(self):
         """Crear la interfaz principal"""
         # Frame principal
@@ -143,15 +161,26 @@ class SistemaPrestamos:
         self.notebook = ttk.Notebook(main_frame)
         self.notebook.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Pestañas
+        # Pestañas: la de préstamos de inmediato, las demás la primera vez que se abren
         self.crear_pestana_prestamos()
-        self.crear_pestana_inventario()
-        self.crear_pestana_usuarios()
-        self.crear_pestana_reportes()
+        for texto, crear_pestana in (("Inventario de Equipos", self.crear_pestana_inventario),
+                                     ("Gestión de Usuarios", self.crear_pestana_usuarios),
+                                     ("Reportes y Exportación", self.crear_pestana_reportes)):
+            frame = ttk.Frame(self.notebook, padding="10")
+            self.notebook.add(frame, text=texto)
+            self.pestanas_pendientes[str(frame)] = (frame, crear_pestana)
+        self.notebook.bind('<<NotebookTabChanged>>', self.construir_pestana)
         
         # Configurar grid para expansión
         main_frame.rowconfigure(1, weight=1)
         
+    def construir_pestana(self, event):
+        """Construir y llenar una pestaña la primera vez que se selecciona"""
+        pendiente = self.pestanas_pendientes.pop(self.notebook.select(), None)
+        if pendiente:
+            frame, crear_pestana = pendiente
+            crear_pestana(frame)
+        
     def crear_pestana_prestamos(self):
         """Crear pestaña de gestión de préstamos"""
         frame = ttk.Frame(self.notebook, padding="10")
@@ -174,25 +203,22 @@ class SistemaPrestamos:
         self.prestamista_combo.grid(row=1, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
         self.prestamista_combo.bind('<KeyRelease>', self.auto_completar_prestamista)
         
-        ttk.Label(form_frame, text="Equipo:").grid(row=2, column=0, sticky=tk.W, pady=2)
-        self.equipo_var = tk.StringVar()
-        self.equipo_combo = ttk.Combobox(form_frame, textvariable=self.equipo_var, width=30)
-        self.equipo_combo.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
-
-        ttk.Label(form_frame, text="Controles:").grid(row=3, column=0, sticky=tk.W, pady=2)
-        self.controles_var = tk.StringVar()
-        self.controles_combo = ttk.Combobox(form_frame, textvariable=self.controles_var, width=30)
-        self.controles_combo.grid(row=3, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
-
-        ttk.Label(form_frame, text="Cables:").grid(row=4, column=0, sticky=tk.W, pady=2)
-        self.cables_var = tk.StringVar()
-        self.cables_combo = ttk.Combobox(form_frame, textvariable=self.cables_var, width=30)
-        self.cables_combo.grid(row=4, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
+        ttk.Label(form_frame, text="Artículo:").grid(row=2, column=0, sticky=tk.W, pady=2)
+        articulo_frame = ttk.Frame(form_frame)
+        articulo_frame.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
+        self.articulo_var = tk.StringVar()
+        self.articulo_combo = ttk.Combobox(articulo_frame, textvariable=self.articulo_var, width=30)
+        self.articulo_combo.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(articulo_frame, text="Agregar", command=self.agregar_articulo).pack(side=tk.LEFT, padx=(5, 0))
 
-        ttk.Label(form_frame, text="Audifonos:").grid(row=5, column=0, sticky=tk.W, pady=2)
-        self.audifonos_var = tk.StringVar()
-        self.audifonos_combo = ttk.Combobox(form_frame, textvariable=self.audifonos_var, width=30)
-        self.audifonos_combo.grid(row=5, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
+        # Artículos del préstamo (se pueden prestar varios de cualquier categoría)
+        ttk.Label(form_frame, text="Artículos del préstamo:").grid(row=3, column=0, sticky=(tk.W, tk.N), pady=2)
+        seleccion_frame = ttk.Frame(form_frame)
+        seleccion_frame.grid(row=3, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
+        self.articulos_listbox = tk.Listbox(seleccion_frame, height=4)
+        self.articulos_listbox.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(seleccion_frame, text="Quitar", command=self.quitar_articulo).pack(side=tk.LEFT, padx=(5, 0), anchor=tk.N)
+        self.articulos_seleccionados = []
         
         ttk.Label(form_frame, text="Estado del equipo:").grid(row=6, column=0, sticky=tk.W, pady=2)
         self.estado_var = tk.StringVar(value="Completo")
@@ -205,9 +231,13 @@ class SistemaPrestamos:
         self.observaciones_text = tk.Text(form_frame, height=3, width=40)
         self.observaciones_text.grid(row=7, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
         
+        ttk.Label(form_frame, text="Fecha límite (opcional):").grid(row=8, column=0, sticky=tk.W, pady=2)
+        self.fecha_limite_var = tk.StringVar()
+        ttk.Entry(form_frame, textvariable=self.fecha_limite_var, width=30).grid(row=8, column=1, sticky=tk.W, padx=(5, 0), pady=2)
+        
         # Botones
         button_frame = ttk.Frame(form_frame)
-        button_frame.grid(row=8, column=0, columnspan=2, pady=10)
+        button_frame.grid(row=9, column=0, columnspan=2, pady=10)
         
         ttk.Button(button_frame, text="Registrar Préstamo", 
                   command=self.registrar_prestamo, style='Custom.TButton').pack(side=tk.LEFT, padx=5)
@@ -224,7 +254,7 @@ class SistemaPrestamos:
         
         # Treeview para mostrar préstamos
 
-        columns = ('ID', 'Usuario', 'Prestamista', 'Equipo', 'Controles', 'Cables', 'Audifonos', 'Estado Equipo', 'Observaciones', 'Fecha Préstamo', 'Fecha Entrega', 'Quien Recibe', 'Estado', 'Observaciones Finales')
+        columns = ('ID', 'Usuario', 'Prestamista', 'Equipo', 'Controles', 'Cables', 'Audifonos', 'Estado Equipo', 'Observaciones', 'Fecha Préstamo', 'Fecha Límite', 'Fecha Entrega', 'Quien Recibe', 'Estado', 'Observaciones Finales')
         self.prestamos_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
 
         # Configurar columnas
@@ -236,13 +266,18 @@ class SistemaPrestamos:
                 self.prestamos_tree.heading(col, text=col)
                 self.prestamos_tree.column(col, width=120)
         
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.prestamos_tree.yview)
-        self.prestamos_tree.configure(yscrollcommand=scrollbar.set)
+        # Scrollbar (la lista virtual solo dibuja los renglones visibles)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
+        self.prestamos_vista = TreeviewVirtual(self.prestamos_tree, scrollbar, self.valores_prestamo,
+                                               etiquetas_de=self.etiquetas_prestamo)
+        self.prestamos_tree.tag_configure('vencido', foreground='#c0392b')
         
         self.prestamos_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
+        self.vencidos_label = ttk.Label(list_frame, text="")
+        self.vencidos_label.grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        
         # Configurar grid
         list_frame.columnconfigure(0, weight=1)
         list_frame.rowconfigure(0, weight=1)
@@ -251,12 +286,10 @@ class SistemaPrestamos:
         
         # Actualizar listas desplegables
         self.actualizar_listas_desplegables()
-        self.actualizar_lista_prestamos()
+        self.actualizar_lista_prestamos(completo=True)
     
-    def crear_pestana_inventario(self):
+    def crear_pestana_inventario(self, frame):
         """Crear pestaña de gestión de inventario"""
-        frame = ttk.Frame(self.notebook, padding="10")
-        self.notebook.add(frame, text="Inventario de Equipos")
         
         # Frame para agregar equipo
         add_frame = ttk.LabelFrame(frame, text="Agregar Nuevo Equipo", padding="10")
@@ -279,6 +312,8 @@ class SistemaPrestamos:
                   command=self.agregar_equipo, style='Custom.TButton').pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame_equipos, text="Eliminar Equipo", 
                   command=self.eliminar_equipo, style='Custom.TButton').pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame_equipos, text="Importar Lista", 
+                  command=lambda: self.importar_archivo('inventario')).pack(side=tk.LEFT, padx=5)
         
         # Frame para lista de equipos
         list_frame = ttk.LabelFrame(frame, text="Equipos Disponibles", padding="10")
@@ -304,12 +339,11 @@ class SistemaPrestamos:
         frame.columnconfigure(0, weight=1)
         frame.rowconfigure(1, weight=1)
         
-        self.actualizar_lista_equipos()
+        self.vistas_construidas.add('equipos')
+        self.actualizar_lista_equipos(completo=True)
     
-    def crear_pestana_usuarios(self):
+    def crear_pestana_usuarios(self, frame):
         """Crear pestaña de gestión de usuarios"""
-        frame = ttk.Frame(self.notebook, padding="10")
-        self.notebook.add(frame, text="Gestión de Usuarios")
         
         # Frame para usuarios
         usuarios_frame = ttk.LabelFrame(frame, text="Usuarios (Solicitantes)", padding="10")
@@ -319,7 +353,9 @@ class SistemaPrestamos:
         self.nuevo_usuario_var = tk.StringVar()
         ttk.Entry(usuarios_frame, textvariable=self.nuevo_usuario_var, width=30).pack(fill=tk.X, pady=(0, 5))
         ttk.Button(usuarios_frame, text="Agregar", 
-                  command=self.agregar_usuario, style='Custom.TButton').pack(pady=(0, 10))
+                  command=self.agregar_usuario, style='Custom.TButton').pack(pady=(0, 5))
+        ttk.Button(usuarios_frame, text="Importar Lista", 
+                  command=lambda: self.importar_archivo('usuarios')).pack(pady=(0, 10))
         
         # Lista de usuarios
         self.usuarios_listbox = tk.Listbox(usuarios_frame, height=15)
@@ -335,7 +371,9 @@ class SistemaPrestamos:
         self.nuevo_prestamista_var = tk.StringVar()
         ttk.Entry(prestamistas_frame, textvariable=self.nuevo_prestamista_var, width=30).pack(fill=tk.X, pady=(0, 5))
         ttk.Button(prestamistas_frame, text="Agregar", 
-                  command=self.agregar_prestamista, style='Custom.TButton').pack(pady=(0, 10))
+                  command=self.agregar_prestamista, style='Custom.TButton').pack(pady=(0, 5))
+        ttk.Button(prestamistas_frame, text="Importar Lista", 
+                  command=lambda: self.importar_archivo('prestamistas')).pack(pady=(0, 10))
         
         # Lista de prestamistas
         self.prestamistas_listbox = tk.Listbox(prestamistas_frame, height=15)
@@ -348,12 +386,11 @@ class SistemaPrestamos:
         frame.columnconfigure(1, weight=1)
         frame.rowconfigure(0, weight=1)
         
-        self.actualizar_listas_usuarios()
+        self.vistas_construidas.add('usuarios')
+        self.actualizar_listas_usuarios(completo=True)
     
-    def crear_pestana_reportes(self):
+    def crear_pestana_reportes(self, frame):
         """Crear pestaña de reportes y exportación"""
-        frame = ttk.Frame(self.notebook, padding="10")
-        self.notebook.add(frame, text="Reportes y Exportación")
         
         # Frame para búsquedas
         search_frame = ttk.LabelFrame(frame, text="Búsquedas", padding="10")
@@ -366,11 +403,35 @@ class SistemaPrestamos:
         ttk.Label(search_frame, text="Tipo:").grid(row=1, column=0, sticky=tk.W, pady=2)
         self.tipo_busqueda_var = tk.StringVar(value="Usuario")
         tipo_combo = ttk.Combobox(search_frame, textvariable=self.tipo_busqueda_var, width=30)
-        tipo_combo['values'] = ('Usuario', 'Prestamista', 'Equipo', 'Estado')
+        tipo_combo['values'] = tuple(CAMPOS_POR_TIPO_BUSQUEDA)
         tipo_combo.grid(row=1, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
         
+        ttk.Label(search_frame, text="Estado:").grid(row=2, column=0, sticky=tk.W, pady=2)
+        self.estado_busqueda_var = tk.StringVar(value="Todos")
+        estado_combo = ttk.Combobox(search_frame, textvariable=self.estado_busqueda_var, width=30, state='readonly')
+        estado_combo['values'] = ('Todos', 'Prestado', 'Entregado')
+        estado_combo.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=2)
+        
+        ttk.Label(search_frame, text="Fechas de:").grid(row=0, column=2, sticky=tk.W, padx=(20, 0), pady=2)
+        self.campo_fecha_var = tk.StringVar(value="Préstamo")
+        campo_fecha_combo = ttk.Combobox(search_frame, textvariable=self.campo_fecha_var, width=15, state='readonly')
+        campo_fecha_combo['values'] = ('Préstamo', 'Entrega')
+        campo_fecha_combo.grid(row=0, column=3, sticky=tk.W, padx=(5, 0), pady=2)
+        
+        ttk.Label(search_frame, text="Desde (AAAA-MM-DD):").grid(row=1, column=2, sticky=tk.W, padx=(20, 0), pady=2)
+        self.desde_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.desde_var, width=18).grid(row=1, column=3, sticky=tk.W, padx=(5, 0), pady=2)
+        
+        ttk.Label(search_frame, text="Hasta (AAAA-MM-DD):").grid(row=2, column=2, sticky=tk.W, padx=(20, 0), pady=2)
+        self.hasta_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.hasta_var, width=18).grid(row=2, column=3, sticky=tk.W, padx=(5, 0), pady=2)
+        
         ttk.Button(search_frame, text="Buscar", 
-                  command=self.buscar_prestamos, style='Custom.TButton').grid(row=2, column=0, columnspan=2, pady=10)
+                  command=self.buscar_prestamos, style='Custom.TButton').grid(row=3, column=0, columnspan=2, pady=10)
+        ttk.Button(search_frame, text="Prestados en el periodo", 
+                  command=self.buscar_vigentes, style='Custom.TButton').grid(row=3, column=2, pady=10)
+        ttk.Button(search_frame, text="Préstamos vencidos", 
+                  command=self.mostrar_vencidos, style='Custom.TButton').grid(row=3, column=3, pady=10)
         
         # Frame para resultados
         results_frame = ttk.LabelFrame(frame, text="Resultados de Búsqueda", padding="10")
@@ -384,8 +445,8 @@ class SistemaPrestamos:
             self.resultados_tree.heading(col, text=col)
             self.resultados_tree.column(col, width=120)
         
-        scrollbar_results = ttk.Scrollbar(results_frame, orient=tk.VERTICAL, command=self.resultados_tree.yview)
-        self.resultados_tree.configure(yscrollcommand=scrollbar_results.set)
+        scrollbar_results = ttk.Scrollbar(results_frame, orient=tk.VERTICAL)
+        self.resultados_vista = TreeviewVirtual(self.resultados_tree, scrollbar_results, self.valores_resultado)
         
         self.resultados_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         scrollbar_results.grid(row=0, column=1, sticky=(tk.N, tk.S))
@@ -398,6 +459,10 @@ class SistemaPrestamos:
                   command=self.exportar_excel, style='Custom.TButton').pack(side=tk.LEFT, padx=5)
         ttk.Button(export_frame, text="Exportar Préstamos Activos", 
                   command=self.exportar_prestamos_activos, style='Custom.TButton').pack(side=tk.LEFT, padx=5)
+        self.exportacion_barra = ttk.Progressbar(export_frame, mode='determinate', length=200)
+        self.exportacion_barra.pack(side=tk.LEFT, padx=5)
+        self.exportacion_label = ttk.Label(export_frame, text="")
+        self.exportacion_label.pack(side=tk.LEFT, padx=5)
         
         # Configurar grid
         results_frame.columnconfigure(0, weight=1)
@@ -415,117 +480,172 @@ class SistemaPrestamos:
         prestamistas_nombres = [f"{p['nombre']}" for p in self.prestamistas]
         self.prestamista_combo['values'] = prestamistas_nombres
 
-        # Actualizar equipos disponibles (incluye controles, cables y audífonos)
-        equipos_disponibles = [f"{e['nombre']} ({e['categoria']})" for e in self.equipos if e['estado'] == 'Disponible']
-        controles_disponibles = [f"{c['nombre']} (Controles)" for c in getattr(self, 'controles', []) if c.get('estado', 'Disponible') == 'Disponible']
-        cables_disponibles = [f"{c['nombre']} (Cable)" for c in getattr(self, 'cables', []) if c.get('estado', 'Disponible') == 'Disponible']
-        audifonos_disponibles = [f"{a['nombre']} (Audifonos)" for a in getattr(self, 'audifonos', []) if a.get('estado', 'Disponible') == 'Disponible']
-        self.equipo_combo['values'] = equipos_disponibles 
-        # Actualizar controles disponibles
-        self.controles_combo['values'] = [f"{c['nombre']}" for c in getattr(self, 'controles', []) if c.get('estado', 'Disponible') == 'Disponible']
-
-        # Actualizar cables disponibles
-        self.cables_combo['values'] = [f"{c['nombre']}" for c in getattr(self, 'cables', []) if c.get('estado', 'Disponible') == 'Disponible']
-
-        # Actualizar audífonos disponibles
-        self.audifonos_combo['values'] = [f"{a['nombre']}" for a in getattr(self, 'audifonos', []) if a.get('estado', 'Disponible') == 'Disponible']
+        # Artículos disponibles de todas las categorías
+        disponibles = self.inventario.disponibles
+        self.articulo_combo['values'] = [etiqueta(coleccion, item)
+                                         for coleccion in COLECCIONES_INVENTARIO
+                                         for item in getattr(self, coleccion)
+                                         if (coleccion, item['id']) in disponibles]
     
     def auto_completar_usuario(self, event):
         """Auto-completar usuario mientras escribe"""
-        texto = self.usuario_var.get().lower()
-        if texto:
-            coincidencias = [u for u in self.usuarios if texto in u['nombre'].lower()]
-            self.usuario_combo['values'] = [u['nombre'] for u in coincidencias]
-        else:
-            self.usuario_combo['values'] = [u['nombre'] for u in self.usuarios]
+        self.programar_autocompletado(self.usuario_combo, self.usuario_var,
+                                      self.indice_usuarios, self.usuarios)
     
     def auto_completar_prestamista(self, event):
         """Auto-completar prestamista mientras escribe"""
-        texto = self.prestamista_var.get().lower()
-        if texto:
-            coincidencias = [p for p in self.prestamistas if texto in p['nombre'].lower()]
-            self.prestamista_combo['values'] = [p['nombre'] for p in coincidencias]
+        self.programar_autocompletado(self.prestamista_combo, self.prestamista_var,
+                                      self.indice_prestamistas, self.prestamistas)
+    
+    def programar_autocompletado(self, combo, variable, indice, registros):
+        """Filtrar el combobox solo cuando se deja de teclear por un momento"""
+        pendiente = self.autocompletado_programado.get(combo)
+        if pendiente:
+            self.root.after_cancel(pendiente)
+        self.autocompletado_programado[combo] = self.root.after(
+            ESPERA_AUTOCOMPLETADO, self.completar_nombres, combo, variable, indice, registros)
+    
+    def completar_nombres(self, combo, variable, indice, registros):
+        """Mostrar en el combobox los nombres que coinciden con lo escrito"""
+        self.autocompletado_programado.pop(combo, None)
+        texto = variable.get()
+        if texto.strip():
+            combo['values'] = indice.buscar(texto)
+        else:
+            combo['values'] = [r['nombre'] for r in registros]
+    
+    def valores_prestamo(self, prestamo):
+        """Valores de un préstamo en el orden de las columnas de prestamos_tree"""
+        return (
+            prestamo['id'],
+            self.nombre_referencia(prestamo, 'usuario'),
+            self.nombre_referencia(prestamo, 'prestamista'),
+            self.nombres_articulos(prestamo, 'equipos'),
+            self.nombres_articulos(prestamo, 'controles'),
+            self.nombres_articulos(prestamo, 'cables'),
+            self.nombres_articulos(prestamo, 'audifonos'),
+            prestamo.get('estado_equipo', 'Completo'),
+            prestamo.get('observaciones', ''),
+            prestamo['fecha_prestamo'],
+            self.fecha_limite(prestamo),
+            prestamo.get('fecha_entrega', 'Pendiente'),
+            prestamo.get('quien_recibe', ''),
+            prestamo['estado'],
+            prestamo.get('observaciones_finales', '')
+        )
+    
+    def etiquetas_prestamo(self, prestamo):
+        """Resaltar en rojo los préstamos vencidos"""
+        return ('vencido',) if prestamo['id'] in self.vencimientos.vencidos else ()
+    
+    def actualizar_lista_prestamos(self, completo=False):
+        """Actualizar la lista de préstamos (solo los registros cambiados, salvo completo=True)"""
+        ids = self.cambios_pendientes.pop('prestamos', set())
+        if completo:
+            self.prestamos_vista.establecer(list(self.prestamos))
         else:
-            self.prestamista_combo['values'] = [p['nombre'] for p in self.prestamistas]
+            self.prestamos_vista.sincronizar(ids, self.prestamos.obtener)
+        
+        vencidos = len(self.vencimientos.vencidos)
+        self.vencidos_label.config(text=f"Préstamos vencidos: {vencidos}" if vencidos else "")
     
-    def actualizar_lista_prestamos(self):
-        """Actualizar la lista de préstamos en el treeview"""
-        # Limpiar treeview
-        for item in self.prestamos_tree.get_children():
-            self.prestamos_tree.delete(item)
-        
-        # Agregar préstamos
-        for prestamo in self.prestamos:
-            self.prestamos_tree.insert('', 'end', values=(
-                prestamo['id'],
-                prestamo['usuario'],
-                prestamo['prestamista'],
-                prestamo['equipo'],
-                prestamo.get('controles', ''),
-                prestamo.get('cables', ''),
-                prestamo.get('audifonos', ''),
-                prestamo.get('estado_equipo', 'Completo'),
-                prestamo.get('observaciones', ''),
-                prestamo['fecha_prestamo'],
-                prestamo.get('fecha_entrega', 'Pendiente'),
-                prestamo.get('quien_recibe', ''),
-                prestamo['estado'],
-                prestamo.get('observaciones_finales', '')
-            ))
+    def valores_equipo(self, coleccion, item):
+        """Valores de un artículo en el orden de las columnas de equipos_tree"""
+        return (
+            item.get('id', ''),
+            item.get('nombre', ''),
+            categoria_de(coleccion, item),
+            item.get('estado', '')
+        )
     
-    def actualizar_lista_equipos(self):
-        """Actualizar la lista de equipos en el treeview"""
-        # Limpiar treeview
-        for item in self.equipos_tree.get_children():
-            self.equipos_tree.delete(item)
-        
-        # Agregar equipos
-        for equipo in self.equipos:
-            self.equipos_tree.insert('', 'end', values=(
-                equipo.get('id', ''),
-                equipo.get('nombre', ''),
-                equipo.get('categoria', ''),
-                equipo.get('estado', '')
-            ))
-        # Agregar controles
-        for control in getattr(self, 'controles', []):
-            self.equipos_tree.insert('', 'end', values=(
-                control.get('id', ''),
-                control.get('nombre', ''),
-                'Controles',
-                control.get('estado', '')
-            ))
-        # Agregar cables
-        for cable in getattr(self, 'cables', []):
-            self.equipos_tree.insert('', 'end', values=(
-                cable.get('id', ''),
-                cable.get('nombre', ''),
-                'Cable',
-                cable.get('estado', '')
-            ))
-        # Agregar audífonos
-        for audifono in getattr(self, 'audifonos', []):
-            self.equipos_tree.insert('', 'end', values=(
-                audifono.get('id', ''),
-                audifono.get('nombre', ''),
-                'Audifonos',
-                audifono.get('estado', '')
-            ))
+    def actualizar_lista_equipos(self, completo=False):
+        """Actualizar la lista de equipos (solo los renglones cambiados, salvo completo=True)"""
+        if completo:
+            # Limpiar treeview y recordar el renglón de cada artículo
+            self.equipos_tree.delete(*self.equipos_tree.get_children())
+            self.equipos_iids = {}
+            for coleccion in COLECCIONES_INVENTARIO:
+                self.cambios_pendientes.pop(coleccion, None)
+                for item in getattr(self, coleccion):
+                    self.equipos_iids[(coleccion, item['id'])] = self.equipos_tree.insert(
+                        '', 'end', values=self.valores_equipo(coleccion, item))
+            return
 
+        for coleccion in COLECCIONES_INVENTARIO:
+            for item_id in self.cambios_pendientes.pop(coleccion, set()):
+                item = getattr(self, coleccion).obtener(item_id)
+                iid = self.equipos_iids.get((coleccion, item_id))
+                if item is None:
+                    if iid:
+                        self.equipos_tree.delete(iid)
+                        del self.equipos_iids[(coleccion, item_id)]
+                elif iid:
+                    self.equipos_tree.item(iid, values=self.valores_equipo(coleccion, item))
+                else:
+                    self.equipos_iids[(coleccion, item_id)] = self.equipos_tree.insert(
+                        '', 'end', values=self.valores_equipo(coleccion, item))
+    
+    def sincronizar_listbox(self, listbox, ids_renglones, coleccion, ids):
+        """Aplicar en un listbox las altas, cambios y bajas de los registros indicados"""
+        for registro_id in ids:
+            registro = getattr(self, coleccion).obtener(registro_id)
+            if registro_id in ids_renglones:
+                indice = ids_renglones.index(registro_id)
+                listbox.delete(indice)
+                if registro is None:
+                    del ids_renglones[indice]
+                else:
+                    listbox.insert(indice, registro['nombre'])
+            elif registro is not None:
+                listbox.insert(tk.END, registro['nombre'])
+                ids_renglones.append(registro_id)
     
-    def actualizar_listas_usuarios(self):
+    def actualizar_listas_usuarios(self, completo=False):
         """Actualizar las listas de usuarios y prestamistas"""
+        if not completo:
+            self.sincronizar_listbox(self.usuarios_listbox, self.usuarios_ids, 'usuarios',
+                                     self.cambios_pendientes.pop('usuarios', set()))
+            self.sincronizar_listbox(self.prestamistas_listbox, self.prestamistas_ids, 'prestamistas',
+                                     self.cambios_pendientes.pop('prestamistas', set()))
+            return
+
         # Limpiar listboxes
         self.usuarios_listbox.delete(0, tk.END)
         self.prestamistas_listbox.delete(0, tk.END)
+        self.cambios_pendientes.pop('usuarios', None)
+        self.cambios_pendientes.pop('prestamistas', None)
         
-        # Agregar usuarios
+        # Agregar usuarios (recordando el id de cada renglón)
+        self.usuarios_ids = []
         for usuario in self.usuarios:
             self.usuarios_listbox.insert(tk.END, usuario['nombre'])
+            self.usuarios_ids.append(usuario['id'])
         
         # Agregar prestamistas
+        self.prestamistas_ids = []
         for prestamista in self.prestamistas:
             self.prestamistas_listbox.insert(tk.END, prestamista['nombre'])
+            self.prestamistas_ids.append(prestamista['id'])
+    
+    def agregar_articulo(self):
+        """Agregar el artículo elegido a la lista del préstamo"""
+        coleccion, item = self.inventario.buscar_etiqueta(self.articulo_var.get())
+        if not item:
+            messagebox.showerror("Error", "Equipo no encontrado")
+            return
+        if any(i is item for _, i in self.articulos_seleccionados):
+            messagebox.showwarning("Advertencia", f"'{item['nombre']}' ya está en el préstamo")
+            return
+        self.articulos_seleccionados.append((coleccion, item))
+        self.articulos_listbox.insert(tk.END, etiqueta(coleccion, item))
+        self.articulo_var.set("")
+    
+    def quitar_articulo(self):
+        """Quitar de la lista del préstamo el artículo seleccionado"""
+        seleccion = self.articulos_listbox.curselection()
+        if seleccion:
+            del self.articulos_seleccionados[seleccion[0]]
+            self.articulos_listbox.delete(seleccion[0])
     
     def registrar_prestamo(self):
         """Registrar un nuevo préstamo"""
@@ -534,188 +654,55 @@ class SistemaPrestamos:
             if not self.usuario_var.get():
                 messagebox.showwarning("Advertencia", "Se recomienda llenar al menos Usuario y Equipo")
 
-            # Verificar si el usuario existe, si no, agregarlo
-            usuario_nombre = self.usuario_var.get().strip()
-            usuario_existe = any(u['nombre'] == usuario_nombre for u in self.usuarios)
-            if not usuario_existe:
-                nuevo_usuario = {
-                    'id': max([u['id'] for u in self.usuarios], default=0) + 1,
-                    'nombre': usuario_nombre,
-                    'tipo': 'Usuario'
-                }
-                self.usuarios.append(nuevo_usuario)
-                messagebox.showinfo("Información", f"Usuario '{usuario_nombre}' agregado automáticamente")
-
-            # Verificar si el prestamista existe, si no, agregarlo
-            prestamista_nombre = self.prestamista_var.get().strip()
-            prestamista_existe = any(p['nombre'] == prestamista_nombre for p in self.prestamistas)
-            if not prestamista_existe:
-                nuevo_prestamista = {
-                    'id': max([p['id'] for p in self.prestamistas], default=0) + 1,
-                    'nombre': prestamista_nombre,
-                    'tipo': 'Prestamista'
-                }
-                self.prestamistas.append(nuevo_prestamista)
-                messagebox.showinfo("Información", f"Prestamista '{prestamista_nombre}' agregado automáticamente")
-
-            # Obtener equipos seleccionados
-            equipo_seleccionado = self.equipo_var.get()
-            control_seleccionado = self.controles_var.get()
-            cable_seleccionado = self.cables_var.get()
-            audifono_seleccionado = self.audifonos_var.get()
-            
-            # Lista para almacenar todos los equipos seleccionados
-            equipos_seleccionados = []
-            
-            # Función auxiliar para buscar un equipo en las listas
-            def buscar_equipo(nombre_buscado, categoria_buscada):
-                if categoria_buscada == 'Computadora':
-                    for equipo in self.equipos:
-                        if f"{equipo['nombre']} ({equipo['categoria']})" == nombre_buscado:
-                            return equipo
-                elif categoria_buscada == 'Controles':
-                    for control in getattr(self, 'controles', []):
-                        if f"{control['nombre']} (Controles)" == nombre_buscado:
-                            return control
-                elif categoria_buscada == 'Cable':
-                    for cable in getattr(self, 'cables', []):
-                        if f"{cable['nombre']} (Cable)" == nombre_buscado:
-                            return cable
-                elif categoria_buscada == 'Audifonos':
-                    for audifono in getattr(self, 'audifonos', []):
-                        if f"{audifono['nombre']} (Audifonos)" == nombre_buscado:
-                            return audifono
-                return None
-            
-            # Buscar equipo principal (computadora)
-            if equipo_seleccionado:
-                equipo_info = buscar_equipo(equipo_seleccionado, 'Computadora')
-                if equipo_info and equipo_info['estado'] == 'Disponible':
-                    equipos_seleccionados.append(('equipo', equipo_info))
-                elif equipo_info and equipo_info['estado'] != 'Disponible':
-                    messagebox.showerror("Error", f"El equipo '{equipo_info['nombre']}' no está disponible")
-                    return
-                elif not equipo_info:
-                    messagebox.showerror("Error", "Equipo no encontrado")
-                    return
-            
-            # Buscar control
-            if control_seleccionado:
-                control_info = buscar_equipo(f"{control_seleccionado} (Controles)", 'Controles')
-                if control_info and control_info['estado'] == 'Disponible':
-                    equipos_seleccionados.append(('controles', control_info))
-                elif control_info and control_info['estado'] != 'Disponible':
-                    messagebox.showerror("Error", f"El control '{control_info['nombre']}' no está disponible")
-                    return
-                elif not control_info:
-                    messagebox.showerror("Error", "Control no encontrado")
-                    return
-            
-            # Buscar cable
-            if cable_seleccionado:
-                cable_info = buscar_equipo(f"{cable_seleccionado} (Cable)", 'Cable')
-                if cable_info and cable_info['estado'] == 'Disponible':
-                    equipos_seleccionados.append(('cables', cable_info))
-                elif cable_info and cable_info['estado'] != 'Disponible':
-                    messagebox.showerror("Error", f"El cable '{cable_info['nombre']}' no está disponible")
-                    return
-                elif not cable_info:
-                    messagebox.showerror("Error", "Cable no encontrado")
-                    return
-            
-            # Buscar audífonos
-            if audifono_seleccionado:
-                audifono_info = buscar_equipo(f"{audifono_seleccionado} (Audifonos)", 'Audifonos')
-                if audifono_info and audifono_info['estado'] == 'Disponible':
-                    equipos_seleccionados.append(('audifonos', audifono_info))
-                elif audifono_info and audifono_info['estado'] != 'Disponible':
-                    messagebox.showerror("Error", f"Los audífonos '{audifono_info['nombre']}' no están disponibles")
-                    return
-                elif not audifono_info:
-                    messagebox.showerror("Error", "Audífonos no encontrados")
-                    return
-            
-            # Verificar que al menos se haya seleccionado un equipo
-            if not equipos_seleccionados:
-                messagebox.showerror("Error", "Debe seleccionar al menos un equipo")
+            try:
+                fecha_limite = self.leer_fecha(self.fecha_limite_var.get(), fin_del_dia=True)
+            except ValueError:
+                messagebox.showerror("Error", "La fecha límite debe tener el formato AAAA-MM-DD [HH:MM]")
                 return
 
-            # Crear nuevo préstamo con todos los equipos seleccionados
-            nuevo_prestamo = {
-                'id': max([p['id'] for p in self.prestamos], default=0) + 1,
-                'usuario': usuario_nombre,
-                'prestamista': prestamista_nombre,
-                'equipo': '',  # Se llenará con el equipo principal si existe
-                'controles': '',  # Se llenará con el control si existe
-                'cables': '',  # Se llenará con el cable si existe
-                'audifonos': '',  # Se llenará con los audífonos si existen
-                'estado_equipo': self.estado_var.get(),
-                'fecha_prestamo': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                'fecha_entrega': None,
-                'quien_recibe': '',
-                'estado': 'Prestado',
-                'observaciones': self.observaciones_text.get("1.0", tk.END).strip()
-            }
-            
-            # Llenar los campos de equipos según lo seleccionado
-            for tipo_equipo, equipo_info in equipos_seleccionados:
-                if tipo_equipo == 'equipo':
-                    nuevo_prestamo['equipo'] = equipo_info['nombre']
-                elif tipo_equipo == 'controles':
-                    nuevo_prestamo['controles'] = equipo_info['nombre']
-                elif tipo_equipo == 'cables':
-                    nuevo_prestamo['cables'] = equipo_info['nombre']
-                elif tipo_equipo == 'audifonos':
-                    nuevo_prestamo['audifonos'] = equipo_info['nombre']
-
-            # Agregar préstamo
-            self.prestamos.append(nuevo_prestamo)
+            # Usuario y prestamista nuevos se agregan automáticamente al registrar
+            usuario_nombre = self.usuario_var.get().strip()
+            prestamista_nombre = self.prestamista_var.get().strip()
+            usuario_nuevo = not self.indice_usuarios.contiene(usuario_nombre)
+            prestamista_nuevo = not self.indice_prestamistas.contiene(prestamista_nombre)
 
-            # Actualizar estado de todos los equipos seleccionados
-            for tipo_equipo, equipo_info in equipos_seleccionados:
-                equipo_info['estado'] = 'Prestado'
+            articulos = [(coleccion, item['id']) for coleccion, item in self.articulos_seleccionados]
+            estado_equipo = self.estado_var.get()
+            observaciones = self.observaciones_text.get("1.0", tk.END).strip()
 
-            # Guardar datos
-            self.guardar_datos()
+            def al_terminar(prestamo):
+                if usuario_nuevo:
+                    messagebox.showinfo("Información", f"Usuario '{usuario_nombre}' agregado automáticamente")
+                if prestamista_nuevo:
+                    messagebox.showinfo("Información", f"Prestamista '{prestamista_nombre}' agregado automáticamente")
 
-            # Actualizar interfaces
-            self.actualizar_lista_prestamos()
-            self.actualizar_lista_equipos()
-            self.actualizar_listas_desplegables()
+                # Limpiar formulario
+                self.limpiar_formulario()
 
-            # Limpiar formulario
-            self.limpiar_formulario()
+                messagebox.showinfo("Éxito", "Préstamo registrado correctamente")
 
-            messagebox.showinfo("Éxito", "Préstamo registrado correctamente")
+            self.en_segundo_plano(
+                lambda: self.prestar(usuario_nombre, prestamista_nombre, articulos,
+                                     estado_equipo=estado_equipo, observaciones=observaciones,
+                                     fecha_limite=fecha_limite),
+                al_terminar, "Error al registrar préstamo")
 
         except Exception as e:
             messagebox.showerror("Error", f"Error al registrar préstamo: {str(e)}")
     
     def marcar_entregado(self):
-        """Marcar un equipo como entregado"""
+        """Marcar como entregados uno o varios préstamos seleccionados"""
         try:
-            # Obtener selección del treeview
-            seleccion = self.prestamos_tree.selection()
+            # Obtener selección del treeview (Ctrl/Shift + clic para varios)
+            seleccion = self.prestamos_vista.seleccionados()
             if not seleccion:
                 messagebox.showwarning("Advertencia", "Por favor seleccione un préstamo para marcar como entregado")
                 return
             
-            # Obtener datos del préstamo
-            item = self.prestamos_tree.item(seleccion[0])
-            prestamo_id = int(item['values'][0])
-            
-            # Buscar préstamo
-            prestamo = None
-            for p in self.prestamos:
-                if p['id'] == prestamo_id:
-                    prestamo = p
-                    break
-            
-            if not prestamo:
-                messagebox.showerror("Error", "Préstamo no encontrado")
-                return
+            # Solo los préstamos que siguen pendientes
+            prestamos = [p for p in map(self.prestamos.obtener, seleccion) if p and p['estado'] == 'Prestado']
             
-            if prestamo['estado'] == 'Entregado':
+            if not prestamos:
                 messagebox.showwarning("Advertencia", "Este equipo ya fue marcado como entregado")
                 return
             
@@ -733,7 +720,11 @@ class SistemaPrestamos:
             main_frame_entrega = ttk.Frame(ventana_entrega, padding="20")
             main_frame_entrega.pack(fill=tk.BOTH, expand=True)
             
-            ttk.Label(main_frame_entrega, text=f"Equipo: {prestamo['equipo']}", font=('Arial', 12, 'bold')).pack(pady=(0, 15))
+            if len(prestamos) == 1:
+                titulo_entrega = f"Equipo: {self.nombres_articulos(prestamos[0])}"
+            else:
+                titulo_entrega = f"Entrega de {len(prestamos)} préstamos"
+            ttk.Label(main_frame_entrega, text=titulo_entrega, font=('Arial', 12, 'bold'), wraplength=400).pack(pady=(0, 15))
             ttk.Label(main_frame_entrega, text="¿Quién recibe el equipo?").pack(pady=(0, 5))
             
             quien_recibe_var = tk.StringVar()
@@ -768,79 +759,19 @@ class SistemaPrestamos:
             mostrar_observaciones()
             
             def confirmar_entrega():
-                if not quien_recibe_var.get().strip():
-                    messagebox.showerror("Error", "Por favor especifique quién recibe el equipo")
-                    return
-
-                # Observaciones si incompleto
-                observaciones = ""
-                if estado_entrega_var.get() == "Incompleto":
-                    observaciones = observaciones_text.get("1.0", tk.END).strip()
-                    # Guardar en observaciones.json
-                    try:
-                        obs_path = os.path.join(self.base_dir, 'observaciones_finales.json')
-                        if os.path.exists(obs_path):
-                            with open(obs_path, 'r', encoding='utf-8') as f:
-                                obs_data = json.load(f)
-                        else:
-                            obs_data = []
-                        obs_data.append({
-                            'prestamo_id': prestamo['id'],
-                            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                            'observaciones': observaciones
-                        })
-                        with open(obs_path, 'w', encoding='utf-8') as f:
-                            json.dump(obs_data, f, ensure_ascii=False, indent=2)
-                    except Exception as e:
-                        messagebox.showerror("Error", f"No se pudo guardar observaciones: {str(e)}")
-
-                # Actualizar préstamo
-                prestamo['fecha_entrega'] = datetime.now().strftime("%Y-%m-%d %H:%M")
-                prestamo['quien_recibe'] = quien_recibe_var.get().strip()
-                prestamo['estado'] = 'Entregado'
-                prestamo['estado_equipo_entrega'] = estado_entrega_var.get()
-                if observaciones:
-                        prestamo['observaciones_finales'] = observaciones
+                def al_terminar(entregados):
+                    ventana_entrega.destroy()
+                    if len(entregados) == 1:
+                        messagebox.showinfo("Éxito", "Equipo marcado como entregado correctamente")
+                    else:
+                        messagebox.showinfo("Éxito", f"{len(entregados)} préstamos marcados como entregados")
 
-                # Actualizar estado de todos los equipos del préstamo
-                # Equipo principal
-                if prestamo.get('equipo'):
-                    for equipo in self.equipos:
-                        if equipo['nombre'] == prestamo['equipo']:
-                            equipo['estado'] = 'Disponible'
-                            break
-
-                # Controles
-                if prestamo.get('controles'):
-                    for control in getattr(self, 'controles', []):
-                        if control['nombre'] == prestamo['controles']:
-                            control['estado'] = 'Disponible'
-                            break
-
-                # Cables
-                if prestamo.get('cables'):
-                    for cable in getattr(self, 'cables', []):
-                        if cable['nombre'] == prestamo['cables']:
-                            cable['estado'] = 'Disponible'
-                            break
-
-                # Audífonos
-                if prestamo.get('audifonos'):
-                    for audifono in getattr(self, 'audifonos', []):
-                        if audifono['nombre'] == prestamo['audifonos']:
-                            audifono['estado'] = 'Disponible'
-                            break
-
-                # Guardar datos
-                self.guardar_datos()
-
-                # Actualizar interfaces
-                self.actualizar_lista_prestamos()
-                self.actualizar_lista_equipos()
-                self.actualizar_listas_desplegables()
-
-                ventana_entrega.destroy()
-                messagebox.showinfo("Éxito", "Equipo marcado como entregado correctamente")
+                ids = [p['id'] for p in prestamos]
+                quien_recibe = quien_recibe_var.get()
+                estado_entrega = estado_entrega_var.get()
+                observaciones = observaciones_text.get("1.0", tk.END).strip()
+                self.en_segundo_plano(lambda: self.entregar(ids, quien_recibe, estado_entrega, observaciones),
+                                      al_terminar, "Error al marcar como entregado")
             
             # Frame para botones
             button_frame_entrega = ttk.Frame(main_frame_entrega)
@@ -857,84 +788,32 @@ class SistemaPrestamos:
     def eliminar_prestamo(self):
         """Eliminar préstamo seleccionado"""
         try:
-            # Obtener selección del treeview
-            seleccion = self.prestamos_tree.selection()
+            # Obtener selección de la lista (puede haber varios seleccionados)
+            seleccion = self.prestamos_vista.seleccionados()
             if not seleccion:
                 messagebox.showwarning("Advertencia", "Por favor seleccione un préstamo para eliminar")
                 return
-            
-            # Obtener datos del préstamo
-            item = self.prestamos_tree.item(seleccion[0])
-            prestamo_id = int(item['values'][0])
+            if len(seleccion) > 1:
+                messagebox.showwarning("Advertencia", "Seleccione un solo préstamo para eliminar")
+                return
             
             # Buscar préstamo
-            prestamo = None
-            for p in self.prestamos:
-                if p['id'] == prestamo_id:
-                    prestamo = p
-                    break
+            prestamo = self.prestamos.obtener(seleccion[0])
             
             if not prestamo:
                 messagebox.showerror("Error", "Préstamo no encontrado")
                 return
             
             # Crear descripción del préstamo para el mensaje
-            equipos_desc = []
-            if prestamo.get('equipo'):
-                equipos_desc.append(f"Equipo: {prestamo['equipo']}")
-            if prestamo.get('controles'):
-                equipos_desc.append(f"Control: {prestamo['controles']}")
-            if prestamo.get('cables'):
-                equipos_desc.append(f"Cable: {prestamo['cables']}")
-            if prestamo.get('audifonos'):
-                equipos_desc.append(f"Audífonos: {prestamo['audifonos']}")
-            
-            descripcion = ", ".join(equipos_desc) if equipos_desc else "Sin equipos"
+            descripcion = self.nombres_articulos(prestamo) or "Sin equipos"
             
             # Confirmar eliminación
             if messagebox.askyesno("Confirmar", f"¿Eliminar el préstamo de: {descripcion}?"):
-                # Si el préstamo está activo, liberar todos los equipos del préstamo
-                if prestamo['estado'] == 'Prestado':
-                    # Equipo principal
-                    if prestamo.get('equipo'):
-                        for equipo in self.equipos:
-                            if equipo['nombre'] == prestamo['equipo']:
-                                equipo['estado'] = 'Disponible'
-                                break
-                    
-                    # Controles
-                    if prestamo.get('controles'):
-                        for control in getattr(self, 'controles', []):
-                            if control['nombre'] == prestamo['controles']:
-                                control['estado'] = 'Disponible'
-                                break
-                    
-                    # Cables
-                    if prestamo.get('cables'):
-                        for cable in getattr(self, 'cables', []):
-                            if cable['nombre'] == prestamo['cables']:
-                                cable['estado'] = 'Disponible'
-                                break
-                    
-                    # Audífonos
-                    if prestamo.get('audifonos'):
-                        for audifono in getattr(self, 'audifonos', []):
-                            if audifono['nombre'] == prestamo['audifonos']:
-                                audifono['estado'] = 'Disponible'
-                                break
-                
-                # Eliminar préstamo
-                self.prestamos.remove(prestamo)
-                
-                # Guardar datos
-                self.guardar_datos()
-                
-                # Actualizar interfaces
-                self.actualizar_lista_prestamos()
-                self.actualizar_lista_equipos()
-                self.actualizar_listas_desplegables()
-                
-                messagebox.showinfo("Éxito", "Préstamo eliminado correctamente")
+                # Si el préstamo está activo, sus equipos quedan disponibles
+                self.en_segundo_plano(
+                    lambda: self.baja_prestamo(prestamo['id']),
+                    lambda eliminado: messagebox.showinfo("Éxito", "Préstamo eliminado correctamente"),
+                    "Error al eliminar préstamo")
                 
         except Exception as e:
             messagebox.showerror("Error", f"Error al eliminar préstamo: {str(e)}")
@@ -943,67 +822,26 @@ class SistemaPrestamos:
         """Limpiar el formulario de préstamo"""
         self.usuario_var.set("")
         self.prestamista_var.set("")
-        self.equipo_var.set("")
-        self.controles_var.set("")
-        self.cables_var.set("")
-        self.audifonos_var.set("")
+        self.articulo_var.set("")
+        self.articulos_seleccionados.clear()
+        self.articulos_listbox.delete(0, tk.END)
         self.estado_var.set("Completo")
+        self.fecha_limite_var.set("")
         self.observaciones_text.delete("1.0", tk.END)
     
     def agregar_equipo(self):
         """Agregar un nuevo equipo al inventario"""
         try:
-            nombre = self.nuevo_equipo_var.get().strip()
-            categoria = self.categoria_var.get().strip()
-            
-            if not nombre or not categoria:
-                messagebox.showerror("Error", "Por favor complete todos los campos")
-                return
-            
-            # Crear nuevo equipo
-            nuevo_equipo = {
-                'id': 0,  # Se calculará según la lista correspondiente
-                'nombre': nombre,
-                'categoria': categoria,
-                'estado': 'Disponible'
-            }
-            
-            # Agregar equipo a la lista correspondiente según la categoría
-            if categoria == 'Computadora':
-                nuevo_equipo['id'] = max([e['id'] for e in self.equipos], default=0) + 1
-                self.equipos.append(nuevo_equipo)
-            elif categoria == 'Controles':
-                nuevo_equipo['id'] = max([c['id'] for c in getattr(self, 'controles', [])], default=0) + 1
-                if not hasattr(self, 'controles'):
-                    self.controles = []
-                self.controles.append(nuevo_equipo)
-            elif categoria == 'Cable':
-                nuevo_equipo['id'] = max([c['id'] for c in getattr(self, 'cables', [])], default=0) + 1
-                if not hasattr(self, 'cables'):
-                    self.cables = []
-                self.cables.append(nuevo_equipo)
-            elif categoria == 'Audifonos':
-                nuevo_equipo['id'] = max([a['id'] for a in getattr(self, 'audifonos', [])], default=0) + 1
-                if not hasattr(self, 'audifonos'):
-                    self.audifonos = []
-                self.audifonos.append(nuevo_equipo)
-            else:
-                # Por defecto, agregar a equipos
-                nuevo_equipo['id'] = max([e['id'] for e in self.equipos], default=0) + 1
-                self.equipos.append(nuevo_equipo)
-            
-            # Guardar datos
-            self.guardar_datos()
-            
-            # Actualizar interfaces
-            self.actualizar_lista_equipos()
-            self.actualizar_listas_desplegables()
-            
-            # Limpiar formulario
-            self.nuevo_equipo_var.set("")
-            self.categoria_var.set("")
+            def al_terminar(agregado):
+                # Limpiar formulario
+                self.nuevo_equipo_var.set("")
+                self.categoria_var.set("")
+                
+                messagebox.showinfo("Éxito", "Equipo agregado correctamente")
             
-            messagebox.showinfo("Éxito", "Equipo agregado correctamente")
+            nombre, categoria = self.nuevo_equipo_var.get(), self.categoria_var.get()
+            self.en_segundo_plano(lambda: self.alta_articulo(nombre, categoria), al_terminar,
+                                  "Error al agregar equipo")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error al agregar equipo: {str(e)}")
@@ -1020,65 +858,27 @@ class SistemaPrestamos:
             # Obtener datos del equipo
             item = self.equipos_tree.item(seleccion[0])
             equipo_id = int(item['values'][0])
+            categoria = item['values'][2]
             
-            # Buscar equipo en todas las listas
-            equipo = None
-            lista_origen = None
-            
-            # Buscar en equipos
-            for e in self.equipos:
-                if e['id'] == equipo_id:
-                    equipo = e
-                    lista_origen = self.equipos
-                    break
-            
-            # Buscar en controles si no se encontró
-            if not equipo:
-                for c in getattr(self, 'controles', []):
-                    if c['id'] == equipo_id:
-                        equipo = c
-                        lista_origen = getattr(self, 'controles', [])
-                        break
-            
-            # Buscar en cables si no se encontró
-            if not equipo:
-                for c in getattr(self, 'cables', []):
-                    if c['id'] == equipo_id:
-                        equipo = c
-                        lista_origen = getattr(self, 'cables', [])
-                        break
-            
-            # Buscar en audífonos si no se encontró
-            if not equipo:
-                for a in getattr(self, 'audifonos', []):
-                    if a['id'] == equipo_id:
-                        equipo = a
-                        lista_origen = getattr(self, 'audifonos', [])
-                        break
-            
+            # Buscar equipo por categoría e id
+            equipo = self.inventario.buscar_id(categoria, equipo_id)
             if not equipo:
                 messagebox.showerror("Error", "Equipo no encontrado")
                 return
             
+            coleccion = COLECCION_POR_CATEGORIA.get(categoria, 'equipos')
+
             # Verificar si tiene préstamos activos
-            prestamos_activos = [p for p in self.prestamos if p['equipo'] == equipo['nombre'] and p['estado'] == 'Prestado']
-            if prestamos_activos:
+            if (coleccion, equipo['id']) not in self.inventario.disponibles:
                 messagebox.showerror("Error", "No se puede eliminar el equipo porque tiene préstamos activos")
                 return
             
             # Confirmar eliminación
             if messagebox.askyesno("Confirmar", f"¿Eliminar el equipo '{equipo['nombre']}'?"):
-                # Eliminar equipo de la lista correspondiente
-                lista_origen.remove(equipo)
-                
-                # Guardar datos
-                self.guardar_datos()
-                
-                # Actualizar interfaces
-                self.actualizar_lista_equipos()
-                self.actualizar_listas_desplegables()
-                
-                messagebox.showinfo("Éxito", "Equipo eliminado correctamente")
+                self.en_segundo_plano(
+                    lambda: self.baja_articulo(coleccion, equipo['id']),
+                    lambda eliminado: messagebox.showinfo("Éxito", "Equipo eliminado correctamente"),
+                    "Error al eliminar equipo")
                 
         except Exception as e:
             messagebox.showerror("Error", f"Error al eliminar equipo: {str(e)}")
@@ -1086,32 +886,15 @@ class SistemaPrestamos:
     def agregar_usuario(self):
         """Agregar un nuevo usuario"""
         try:
-            nombre = self.nuevo_usuario_var.get().strip()
-            if not nombre:
-                messagebox.showerror("Error", "Por favor ingrese el nombre del usuario")
-                return
-            
-            # Crear nuevo usuario
-            nuevo_usuario = {
-                'id': max([u['id'] for u in self.usuarios], default=0) + 1,
-                'nombre': nombre,
-                'tipo': 'Usuario'
-            }
-            
-            # Agregar usuario
-            self.usuarios.append(nuevo_usuario)
-            
-            # Guardar datos
-            self.guardar_datos()
-            
-            # Actualizar interfaces
-            self.actualizar_listas_usuarios()
-            self.actualizar_listas_desplegables()
-            
-            # Limpiar formulario
-            self.nuevo_usuario_var.set("")
+            def al_terminar(persona):
+                # Limpiar formulario
+                self.nuevo_usuario_var.set("")
+                
+                messagebox.showinfo("Éxito", "Usuario agregado correctamente")
             
-            messagebox.showinfo("Éxito", "Usuario agregado correctamente")
+            nombre = self.nuevo_usuario_var.get()
+            self.en_segundo_plano(lambda: self.alta_persona('usuarios', nombre), al_terminar,
+                                  "Error al agregar usuario")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error al agregar usuario: {str(e)}")
@@ -1119,36 +902,48 @@ class SistemaPrestamos:
     def agregar_prestamista(self):
         """Agregar un nuevo prestamista"""
         try:
-            nombre = self.nuevo_prestamista_var.get().strip()
-            if not nombre:
-                messagebox.showerror("Error", "Por favor ingrese el nombre del prestamista")
-                return
-            
-            # Crear nuevo prestamista
-            nuevo_prestamista = {
-                'id': max([p['id'] for p in self.prestamistas], default=0) + 1,
-                'nombre': nombre,
-                'tipo': 'Prestamista'
-            }
-            
-            # Agregar prestamista
-            self.prestamistas.append(nuevo_prestamista)
-            
-            # Guardar datos
-            self.guardar_datos()
-            
-            # Actualizar interfaces
-            self.actualizar_listas_usuarios()
-            self.actualizar_listas_desplegables()
-            
-            # Limpiar formulario
-            self.nuevo_prestamista_var.set("")
+            def al_terminar(persona):
+                # Limpiar formulario
+                self.nuevo_prestamista_var.set("")
+                
+                messagebox.showinfo("Éxito", "Prestamista agregado correctamente")
             
-            messagebox.showinfo("Éxito", "Prestamista agregado correctamente")
+            nombre = self.nuevo_prestamista_var.get()
+            self.en_segundo_plano(lambda: self.alta_persona('prestamistas', nombre), al_terminar,
+                                  "Error al agregar prestamista")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error al agregar prestamista: {str(e)}")
     
+    def importar_archivo(self, destino):
+        """Importar usuarios, prestamistas o inventario desde un archivo Excel o CSV"""
+        try:
+            archivo = filedialog.askopenfilename(
+                filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("All files", "*.*")],
+                title="Importar lista"
+            )
+            if not archivo:
+                return
+
+            # El módulo de importación se carga al usarlo para no retrasar el arranque
+            from importacion import leer_renglones
+
+            def importar():
+                # Leer el archivo completo antes de tomar los datos: un error de lectura no deja nada a medias
+                renglones = list(leer_renglones(archivo, ('nombre', 'categoria')))
+                return self.importar_renglones(destino, renglones)
+
+            def al_terminar(resultado):
+                agregados, omitidos = resultado
+                messagebox.showinfo("Éxito", f"{agregados} registro(s) importado(s); "
+                                             f"{omitidos} omitido(s) por repetidos, incompletos o de categoría desconocida")
+
+            # La lectura del archivo también se hace en el hilo de datos
+            self.en_segundo_plano(importar, al_terminar, "Error al importar")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al importar: {str(e)}")
+
     def eliminar_usuario(self):
         """Eliminar usuario seleccionado"""
         try:
@@ -1158,26 +953,14 @@ class SistemaPrestamos:
                 return
             
             indice = seleccion[0]
-            usuario = self.usuarios[indice]
+            usuario = self.usuarios.obtener(self.usuarios_ids[indice])
             
             if messagebox.askyesno("Confirmar", f"¿Eliminar al usuario '{usuario['nombre']}'?"):
-                # Verificar si tiene préstamos activos
-                prestamos_activos = [p for p in self.prestamos if p['usuario'] == usuario['nombre'] and p['estado'] == 'Prestado']
-                if prestamos_activos:
-                    messagebox.showerror("Error", "No se puede eliminar el usuario porque tiene préstamos activos")
-                    return
-                
-                # Eliminar usuario
-                del self.usuarios[indice]
-                
-                # Guardar datos
-                self.guardar_datos()
-                
-                # Actualizar interfaces
-                self.actualizar_listas_usuarios()
-                self.actualizar_listas_desplegables()
-                
-                messagebox.showinfo("Éxito", "Usuario eliminado correctamente")
+                # Se rechaza si tiene préstamos activos
+                self.en_segundo_plano(
+                    lambda: self.baja_persona('usuarios', usuario['id']),
+                    lambda persona: messagebox.showinfo("Éxito", "Usuario eliminado correctamente"),
+                    "Error al eliminar usuario")
                 
         except Exception as e:
             messagebox.showerror("Error", f"Error al eliminar usuario: {str(e)}")
@@ -1191,140 +974,155 @@ class SistemaPrestamos:
                 return
             
             indice = seleccion[0]
-            prestamista = self.prestamistas[indice]
+            prestamista = self.prestamistas.obtener(self.prestamistas_ids[indice])
             
             if messagebox.askyesno("Confirmar", f"¿Eliminar al prestamista '{prestamista['nombre']}'?"):
-                # Verificar si tiene préstamos activos
-                prestamos_activos = [p for p in self.prestamos if p['prestamista'] == prestamista['nombre'] and p['estado'] == 'Prestado']
-                if prestamos_activos:
-                    messagebox.showerror("Error", "No se puede eliminar el prestamista porque tiene préstamos activos")
-                    return
-                
-                # Eliminar prestamista
-                del self.prestamistas[indice]
-                
-                # Guardar datos
-                self.guardar_datos()
-                
-                # Actualizar interfaces
-                self.actualizar_listas_usuarios()
-                self.actualizar_listas_desplegables()
-                
-                messagebox.showinfo("Éxito", "Prestamista eliminado correctamente")
+                # Se rechaza si tiene préstamos activos
+                self.en_segundo_plano(
+                    lambda: self.baja_persona('prestamistas', prestamista['id']),
+                    lambda persona: messagebox.showinfo("Éxito", "Prestamista eliminado correctamente"),
+                    "Error al eliminar prestamista")
                 
         except Exception as e:
             messagebox.showerror("Error", f"Error al eliminar prestamista: {str(e)}")
     
+    def valores_resultado(self, prestamo):
+        """Valores de un préstamo en el orden de las columnas de resultados_tree"""
+        return (
+            prestamo['id'],
+            self.nombre_referencia(prestamo, 'usuario'),
+            self.nombre_referencia(prestamo, 'prestamista'),
+            self.nombres_articulos(prestamo),
+            prestamo.get('estado_equipo', 'Completo'),
+            prestamo.get('observaciones', ''),
+            prestamo['fecha_prestamo'],
+            prestamo.get('quien_recibe', ''),
+            prestamo['estado'],
+            prestamo.get('fecha_entrega') or 'Pendiente',
+            prestamo.get('observaciones_finales', '')
+        )
+    
     def buscar_prestamos(self):
-        """Buscar préstamos según criterios"""
+        """Buscar préstamos combinando texto, estado y rango de fechas"""
         try:
-            busqueda = self.busqueda_var.get().strip().lower()
-            tipo = self.tipo_busqueda_var.get()
-            
-            if not busqueda:
-                # Mostrar todos los préstamos
-                resultados = self.prestamos
-            else:
-                # Filtrar según tipo
-                resultados = []
-                for prestamo in self.prestamos:
-                    if tipo == "Usuario" and busqueda in prestamo['usuario'].lower():
-                        resultados.append(prestamo)
-                    elif tipo == "Prestamista" and busqueda in prestamo['prestamista'].lower():
-                        resultados.append(prestamo)
-                    elif tipo == "Equipo" and busqueda in prestamo['equipo'].lower():
-                        resultados.append(prestamo)
-                    elif tipo == "Estado" and busqueda in prestamo['estado'].lower():
-                        resultados.append(prestamo)
-            
-            # Limpiar treeview de resultados
-            for item in self.resultados_tree.get_children():
-                self.resultados_tree.delete(item)
+            try:
+                resultados = self.buscar(texto=self.busqueda_var.get(),
+                                         tipo=self.tipo_busqueda_var.get(),
+                                         estado=self.estado_busqueda_var.get(),
+                                         campo_fecha=self.campo_fecha_var.get(),
+                                         desde=self.desde_var.get(),
+                                         hasta=self.hasta_var.get())
+            except ErrorPrestamo as e:
+                messagebox.showerror("Error", str(e))
+                return
             
-            # Agregar resultados
-            for prestamo in resultados:
-                self.resultados_tree.insert('', 'end', values=(
-                    prestamo['id'],
-                    prestamo['usuario'],
-                    prestamo['prestamista'],
-                    prestamo['equipo'],
-                    prestamo.get('estado_equipo', 'Completo'),
-                    prestamo['fecha_prestamo'],
-                    prestamo.get('fecha_entrega', 'Pendiente'),
-                    prestamo.get('quien_recibe', ''),
-                    prestamo['estado']
-                ))
+            # Solo se dibujan los renglones visibles de los resultados
+            self.resultados_vista.establecer(resultados)
             
             messagebox.showinfo("Búsqueda", f"Se encontraron {len(resultados)} resultado(s)")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error en la búsqueda: {str(e)}")
     
-    def exportar_excel(self):
-        """Exportar todos los datos a Excel"""
+    def buscar_vigentes(self):
+        """Mostrar lo que estaba prestado en un momento o en algún punto del periodo Desde-Hasta"""
         try:
-            # Crear DataFrame con préstamos
-            df_prestamos = pd.DataFrame(self.prestamos)
-            
-            # Crear DataFrame con equipos
-            df_equipos = pd.DataFrame(self.equipos)
+            try:
+                resultados = self.vigentes(self.desde_var.get(), self.hasta_var.get())
+            except ErrorPrestamo as e:
+                messagebox.showerror("Error", str(e))
+                return
             
-            # Crear DataFrame con usuarios
-            df_usuarios = pd.DataFrame(self.usuarios)
+            self.resultados_vista.establecer(resultados)
             
-            # Crear DataFrame con prestamistas
-            df_prestamistas = pd.DataFrame(self.prestamistas)
-            
-            # Solicitar archivo de destino
-            archivo = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-                title="Guardar archivo Excel"
-            )
-            
-            if archivo:
-                # Crear archivo Excel con múltiples hojas
-                with pd.ExcelWriter(archivo, engine='openpyxl') as writer:
-                    df_prestamos.to_excel(writer, sheet_name='Préstamos', index=False)
-                    df_equipos.to_excel(writer, sheet_name='Equipos', index=False)
-                    df_usuarios.to_excel(writer, sheet_name='Usuarios', index=False)
-                    df_prestamistas.to_excel(writer, sheet_name='Prestamistas', index=False)
-                
-                messagebox.showinfo("Éxito", f"Archivo exportado correctamente: {archivo}")
+            messagebox.showinfo("Búsqueda", f"{len(resultados)} préstamo(s) estuvieron fuera en el periodo")
             
         except Exception as e:
-            messagebox.showerror("Error", f"Error al exportar: {str(e)}")
+            messagebox.showerror("Error", f"Error en la búsqueda: {str(e)}")
+    
+    def mostrar_vencidos(self):
+        """Mostrar los préstamos vencidos, del más atrasado al más reciente"""
+        resultados = self.vencidos()
+        self.resultados_vista.establecer(resultados)
+        messagebox.showinfo("Búsqueda", f"{len(resultados)} préstamo(s) vencido(s)")
+    
+    def exportar_excel(self):
+        """Exportar todas las colecciones a Excel (o CSV)"""
+        # El módulo de exportación se carga al usarlo para no retrasar el arranque
+        from exportacion import HOJAS
+
+        hojas = [(nombre, list(getattr(self, coleccion))) for nombre, coleccion in HOJAS]
+        self.iniciar_exportacion(hojas, "Guardar archivo Excel")
     
     def exportar_prestamos_activos(self):
-        """Exportar solo préstamos activos a Excel"""
+        """Exportar solo préstamos activos a Excel (o CSV)"""
+        prestamos_activos = [p for p in self.prestamos if p['estado'] == 'Prestado']
+        
+        if not prestamos_activos:
+            messagebox.showinfo("Información", "No hay préstamos activos para exportar")
+            return
+        
+        self.iniciar_exportacion([('Préstamos activos', prestamos_activos)], "Guardar préstamos activos")
+    
+    def iniciar_exportacion(self, hojas, titulo):
+        """Pedir el archivo de destino y escribirlo en un hilo aparte"""
         try:
-            # Filtrar préstamos activos
-            prestamos_activos = [p for p in self.prestamos if p['estado'] == 'Prestado']
-            
-            if not prestamos_activos:
-                messagebox.showinfo("Información", "No hay préstamos activos para exportar")
+            if self.exportacion is not None:
+                messagebox.showwarning("Advertencia", "Ya hay una exportación en curso")
                 return
             
-            # Crear DataFrame
-            df = pd.DataFrame(prestamos_activos)
-            
             # Solicitar archivo de destino
             archivo = filedialog.asksaveasfilename(
                 defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-                title="Guardar préstamos activos"
+                filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("All files", "*.*")],
+                title=titulo
             )
             
             if archivo:
-                df.to_excel(archivo, index=False)
-                messagebox.showinfo("Éxito", f"Préstamos activos exportados: {archivo}")
+                from exportacion import ExportacionSegundoPlano
+
+                self.exportacion = ExportacionSegundoPlano(archivo, hojas)
+                self.exportacion.iniciar()
+                self.exportacion_label.config(text="Exportando...")
+                self.revisar_exportacion()
             
         except Exception as e:
             messagebox.showerror("Error", f"Error al exportar: {str(e)}")
     
+    def revisar_exportacion(self):
+        """Actualizar la barra de avance hasta que termine la exportación"""
+        exportacion = self.exportacion
+        self.exportacion_barra['value'] = 100 * exportacion.escritos / max(1, exportacion.total)
+        
+        if not exportacion.terminada():
+            self.root.after(100, self.revisar_exportacion)
+            return
+        
+        self.exportacion = None
+        self.exportacion_barra['value'] = 0
+        self.exportacion_label.config(text="")
+        if exportacion.error:
+            messagebox.showerror("Error", f"Error al exportar: {str(exportacion.error)}")
+        else:
+            messagebox.showinfo("Éxito", f"Archivo exportado correctamente: {exportacion.ruta}")
+    
+    def al_cerrar_ventana(self):
+        """Cerrar la ventana cuando el hilo de datos termine lo que tiene encolado"""
+        self.cerrando = True
+        if self.hilo_datos.pendientes:
+            self.root.after(100, self.al_cerrar_ventana)
+            return
+        self.root.destroy()
+
     def ejecutar(self):
         """Ejecutar la aplicación"""
         self.root.mainloop()
+        self.hilo_datos.cerrar()
+
+        # Al cerrar la ventana, guardar la instantánea para el siguiente arranque
+        self.cerrar()
+        if self.exportacion is not None:
+            self.exportacion.hilo.join()
 
 if __name__ == "__main__":
     app = SistemaPrestamos()
@@ -0,0 +1,276 @@
+"""Componentes de interfaz reutilizables"""
+import queue
+import threading
+import tkinter as tk
+from tkinter import font, ttk
+
+
+class TreeviewVirtual:
+    """Treeview que solo materializa los renglones visibles de una lista larga"""
+
+    def __init__(self, tree, scrollbar, valores_de, clave=lambda r: r['id'], etiquetas_de=lambda r: ()):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.valores_de = valores_de
+        self.etiquetas_de = etiquetas_de
+        self.clave = clave
+        self.registros = []
+        # Posición de cada clave en self.registros
+        self.posiciones = {}
+        self.visibles = {}
+        self.inicio = 0
+        # Claves seleccionadas, incluidas las de renglones fuera de la ventana visible
+        self.seleccion = set()
+
+        self.scrollbar.configure(command=self.desplazar)
+        self.tree.bind('<Configure>', lambda e: self.dibujar())
+        self.tree.bind('<<TreeviewSelect>>', self.al_seleccionar, add='+')
+        self.tree.bind('<Button-1>', self.al_presionar, add='+')
+        self.tree.bind('<MouseWheel>', lambda e: self.mover(-1 if e.delta > 0 else 1, 'units'))
+        self.tree.bind('<Button-4>', lambda e: self.mover(-1, 'units'))
+        self.tree.bind('<Button-5>', lambda e: self.mover(1, 'units'))
+
+        # El Treeview solo conoce los renglones de la ventana: el teclado también la desplaza
+        self.tree.bind('<Up>', lambda e: self.mover_foco(-1))
+        self.tree.bind('<Down>', lambda e: self.mover_foco(1))
+        self.tree.bind('<Prior>', lambda e: self.mover_foco(-self.filas_visibles()))
+        self.tree.bind('<Next>', lambda e: self.mover_foco(self.filas_visibles()))
+        self.tree.bind('<Home>', lambda e: self.mover_foco(-len(self.registros)))
+        self.tree.bind('<End>', lambda e: self.mover_foco(len(self.registros)))
+
+    def medidas_fila(self):
+        """(alto de un renglón, alto del encabezado) medidos en pantalla
+
+        El tema clam no define rowheight y con fuentes grandes o escalado de
+        pantalla los renglones son más altos; mientras no haya renglones
+        dibujados se estima con la fuente.
+        """
+        for iid in self.tree.get_children():
+            caja = self.tree.bbox(iid)
+            if caja:
+                return caja[3], caja[1]
+        altura = ttk.Style().lookup('Treeview', 'rowheight') or font.nametofont('TkDefaultFont').metrics('linespace')
+        return int(altura), int(altura)
+
+    def filas_visibles(self):
+        """Número de renglones que caben en el Treeview"""
+        alto = self.tree.winfo_height()
+        if alto <= 1:
+            # Aún no se ha dibujado la ventana
+            return int(self.tree.cget('height'))
+        altura_fila, encabezado = self.medidas_fila()
+        return max(1, (alto - encabezado) // max(1, altura_fila))
+
+    def establecer(self, registros):
+        """Reemplazar la lista de registros y redibujar la ventana visible"""
+        self.registros = registros
+        self.posiciones = {self.clave(r): posicion for posicion, r in enumerate(registros)}
+        self.seleccion &= self.posiciones.keys()
+        self.dibujar()
+
+    def sincronizar(self, claves, obtener):
+        """Aplicar altas, cambios y bajas de los registros indicados sin reconstruir la lista"""
+        altas = False
+        bajas = set()
+        for clave in claves:
+            registro = obtener(clave)
+            if registro is None:
+                if clave in self.posiciones:
+                    bajas.add(clave)
+            elif clave in self.posiciones:
+                # Tras recargar de disco el registro es otro objeto: no dibujar el viejo
+                self.registros[self.posiciones[clave]] = registro
+            else:
+                self.posiciones[clave] = len(self.registros)
+                self.registros.append(registro)
+                altas = True
+
+        if bajas:
+            self.registros = [r for r in self.registros if self.clave(r) not in bajas]
+            self.posiciones = {self.clave(r): posicion for posicion, r in enumerate(self.registros)}
+            self.seleccion -= bajas
+
+        if altas or bajas:
+            # Cambió la posición de los renglones: redibujar la ventana visible
+            self.dibujar()
+        else:
+            for iid, registro in self.visibles.items():
+                clave = self.clave(registro)
+                if clave in claves:
+                    registro = self.visibles[iid] = self.registros[self.posiciones[clave]]
+                    self.tree.item(iid, values=self.valores_de(registro), tags=self.etiquetas_de(registro))
+
+    def dibujar(self, medir=True):
+        """Materializar solo los renglones de la ventana visible"""
+        filas = self.filas_visibles()
+        total = len(self.registros)
+        self.inicio = max(0, min(self.inicio, total - filas))
+        ventana = self.registros[self.inicio:self.inicio + filas]
+
+        # Recoger primero cualquier clic cuyo <<TreeviewSelect>> aún no se procesa
+        self.al_seleccionar()
+
+        # Reutilizar los renglones existentes en vez de borrarlos todos
+        hijos = self.tree.get_children()
+        self.visibles = {}
+        for i, registro in enumerate(ventana):
+            if i < len(hijos):
+                iid = hijos[i]
+                self.tree.item(iid, values=self.valores_de(registro), tags=self.etiquetas_de(registro))
+            else:
+                iid = self.tree.insert('', 'end', values=self.valores_de(registro), tags=self.etiquetas_de(registro))
+            self.visibles[iid] = registro
+        if len(hijos) > len(ventana):
+            self.tree.delete(*hijos[len(ventana):])
+        # Si sobraban renglones el Treeview pudo desplazarse solo; la ventana empieza arriba
+        self.tree.yview_moveto(0)
+        # La selección se conserva por registro, no por renglón
+        self.tree.selection_set([iid for iid, r in self.visibles.items() if self.clave(r) in self.seleccion])
+
+        if total:
+            self.scrollbar.set(self.inicio / total, (self.inicio + len(ventana)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+        # Sin renglones el alto se había estimado; ya dibujados se mide y se corrige una vez
+        if medir and self.filas_visibles() != filas:
+            self.dibujar(medir=False)
+
+    def al_presionar(self, event):
+        """Un clic en un renglón sin Shift ni Control empieza una selección nueva"""
+        if not event.state & 0x0005 and self.tree.identify_region(event.x, event.y) in ('cell', 'tree'):
+            self.seleccion.clear()
+
+    def al_seleccionar(self, event=None):
+        """Copiar la selección de los renglones visibles; la de los demás se conserva"""
+        visibles = {self.clave(r) for r in self.visibles.values()}
+        marcadas = {self.clave(self.visibles[iid]) for iid in self.tree.selection() if iid in self.visibles}
+        self.seleccion = (self.seleccion - visibles) | marcadas
+
+    def seleccionados(self):
+        """Claves seleccionadas, en el orden de la lista"""
+        return [self.clave(r) for r in self.registros if self.clave(r) in self.seleccion]
+
+    def mover(self, cantidad, unidad):
+        """Desplazar la ventana por renglones o por páginas"""
+        paso = self.filas_visibles() if unidad == 'pages' else 1
+        self.inicio += int(cantidad) * paso
+        self.dibujar()
+        return 'break'
+
+    def mover_foco(self, cantidad):
+        """Mover el renglón activo (flechas, Re Pág, Av Pág) desplazando la ventana al llegar al borde"""
+        if not self.registros:
+            return 'break'
+        hijos = self.tree.get_children()
+        foco = self.tree.focus()
+        actual = self.inicio + hijos.index(foco) if foco in self.visibles else self.inicio
+        nuevo = max(0, min(len(self.registros) - 1, actual + cantidad))
+
+        filas = self.filas_visibles()
+        if nuevo < self.inicio:
+            self.inicio = nuevo
+        elif nuevo >= self.inicio + filas:
+            self.inicio = nuevo - filas + 1
+        self.dibujar()
+        hijos = self.tree.get_children()
+        if not 0 <= nuevo - self.inicio < len(hijos):
+            # Al medir los renglones cambió cuántos caben
+            self.inicio = max(0, nuevo - len(hijos) + 1)
+            self.dibujar(medir=False)
+            hijos = self.tree.get_children()
+
+        # Como con las flechas del Treeview: queda seleccionado solo el nuevo renglón
+        iid = hijos[nuevo - self.inicio]
+        self.seleccion = {self.clave(self.registros[nuevo])}
+        self.tree.selection_set(iid)
+        self.tree.focus(iid)
+        return 'break'
+
+    def desplazar(self, accion, *args):
+        """Comando de la barra de desplazamiento (moveto / scroll)"""
+        if accion == 'moveto':
+            self.inicio = int(float(args[0]) * len(self.registros))
+            self.dibujar()
+        elif accion == 'scroll':
+            self.mover(args[0], args[1])
+
+
+class HiloDatos:
+    """Hilo que ejecuta en orden las operaciones que esperan al disco
+
+    La ventana encola cada operación con enviar() y sigue respondiendo; el
+    resultado (o el error) vuelve al hilo de Tk con root.after.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.cola = queue.Queue()
+        # Operaciones enviadas cuya respuesta aún no se entrega a la ventana
+        self.pendientes = 0
+        self.detenido = threading.Event()
+        self.hilo = threading.Thread(target=self.ejecutar, name='datos', daemon=True)
+        self.hilo.start()
+
+    def enviar(self, operacion, al_terminar, al_fallar):
+        """Encolar una operación; al_terminar(resultado) o al_fallar(error) se llaman en el hilo de Tk"""
+        self.pendientes += 1
+        self.cola.put((operacion, al_terminar, al_fallar))
+
+    def ejecutar(self):
+        """Bucle del hilo: una operación a la vez, en el orden en que se enviaron"""
+        while True:
+            tarea = self.cola.get()
+            if tarea is None:
+                return
+            operacion, al_terminar, al_fallar = tarea
+            try:
+                resultado = operacion()
+            except Exception as e:
+                respuesta = (al_fallar, e)
+            else:
+                respuesta = (al_terminar, resultado)
+            try:
+                self.root.after(0, self.responder, *respuesta)
+            except (RuntimeError, tk.TclError):
+                # La ventana ya se cerró: nadie espera la respuesta
+                pass
+
+    def responder(self, funcion, valor):
+        """Entregar la respuesta de una operación en el hilo de Tk"""
+        self.pendientes -= 1
+        funcion(valor)
+
+    def en_hilo_tk(self, funcion, *args):
+        """Ejecutar funcion en el hilo de Tk y esperar su resultado
+
+        Desde el hilo de datos la llamada se pasa a la ventana con root.after;
+        desde cualquier otro hilo se ejecuta directamente.
+        """
+        if threading.current_thread() is not self.hilo:
+            return funcion(*args)
+
+        listo = threading.Event()
+        salida = {}
+
+        def llamar():
+            try:
+                salida['resultado'] = funcion(*args)
+            except BaseException as e:
+                salida['error'] = e
+            finally:
+                listo.set()
+
+        self.root.after(0, llamar)
+        while not listo.wait(0.1):
+            if self.detenido.is_set():
+                raise RuntimeError("La ventana se cerró antes de terminar la operación")
+        if 'error' in salida:
+            raise salida['error']
+        return salida['resultado']
+
+    def cerrar(self):
+        """Detener el hilo; se llama cuando ya no queda nada encolado"""
+        self.detenido.set()
+        self.cola.put(None)
+        self.hilo.join()
@@ -0,0 +1,102 @@
+"""Exportación de colecciones a Excel o CSV, escribiendo renglón por renglón"""
+import csv
+import json
+import os
+import threading
+
+# Hojas del libro completo: (nombre de la hoja, colección)
+HOJAS = (
+    ('Préstamos', 'prestamos'),
+    ('Equipos', 'equipos'),
+    ('Controles', 'controles'),
+    ('Cables', 'cables'),
+    ('Audifonos', 'audifonos'),
+    ('Usuarios', 'usuarios'),
+    ('Prestamistas', 'prestamistas'),
+)
+
+
+def columnas_de(registros):
+    """Unión de los campos de los registros, en el orden en que aparecen"""
+    columnas = {}
+    for registro in registros:
+        for campo in registro:
+            columnas.setdefault(campo, None)
+    return list(columnas)
+
+
+def valor_celda(valor):
+    """Convertir listas y diccionarios a texto para que quepan en una celda"""
+    if isinstance(valor, (list, tuple, dict)):
+        return json.dumps(valor, ensure_ascii=False)
+    return valor
+
+
+def escribir_xlsx(ruta, hojas, avance):
+    """Libro en modo de solo escritura: openpyxl no guarda los renglones en memoria"""
+    # openpyxl solo se carga si de verdad se exporta a Excel
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    for nombre, registros in hojas:
+        hoja = libro.create_sheet(nombre)
+        columnas = columnas_de(registros)
+        hoja.append(columnas)
+        for registro in registros:
+            hoja.append([valor_celda(registro.get(campo)) for campo in columnas])
+            avance()
+    libro.save(ruta)
+
+
+def escribir_csv(ruta, hojas, avance):
+    """Un archivo CSV por hoja (ruta_Hoja.csv si hay más de una)"""
+    base, extension = os.path.splitext(ruta)
+    for nombre, registros in hojas:
+        destino = ruta if len(hojas) == 1 else f"{base}_{nombre}{extension}"
+        columnas = columnas_de(registros)
+        # utf-8-sig para que Excel reconozca los acentos
+        with open(destino, 'w', newline='', encoding='utf-8-sig') as f:
+            escritor = csv.writer(f)
+            escritor.writerow(columnas)
+            for registro in registros:
+                escritor.writerow([valor_celda(registro.get(campo)) for campo in columnas])
+                avance()
+
+
+def exportar(ruta, hojas, avance=lambda: None):
+    """Escribir las hojas [(nombre, registros)] en Excel o CSV según la extensión"""
+    if ruta.lower().endswith('.csv'):
+        escribir_csv(ruta, hojas, avance)
+    else:
+        escribir_xlsx(ruta, hojas, avance)
+
+
+class ExportacionSegundoPlano:
+    """Escribe una exportación en un hilo aparte; la interfaz consulta el avance"""
+
+    def __init__(self, ruta, hojas):
+        self.ruta = ruta
+        self.hojas = hojas
+        self.total = sum(len(registros) for _, registros in hojas)
+        self.escritos = 0
+        self.error = None
+        self.hilo = threading.Thread(target=self.ejecutar, name='exportacion', daemon=True)
+
+    def iniciar(self):
+        """Arrancar el hilo de escritura"""
+        self.hilo.start()
+
+    def terminada(self):
+        """Indica si el hilo ya terminó (con o sin error)"""
+        return not self.hilo.is_alive()
+
+    def ejecutar(self):
+        """Escribir el archivo y guardar el error, si lo hay, para la interfaz"""
+        try:
+            exportar(self.ruta, self.hojas, self.avanzar)
+        except Exception as e:
+            self.error = e
+
+    def avanzar(self):
+        """Contar un renglón escrito"""
+        self.escritos += 1
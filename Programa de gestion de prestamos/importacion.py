@@ -0,0 +1,77 @@
+"""Importación de listas (usuarios, prestamistas, inventario) desde Excel o CSV, renglón por renglón"""
+import codecs
+import csv
+import itertools
+
+from indices import normalizar
+
+
+def texto_celda(valor):
+    """Texto de una celda, sin espacios sobrantes"""
+    if valor is None:
+        return ''
+    return ' '.join(str(valor).split())
+
+
+def codificacion_csv(ruta):
+    """'utf-8-sig' si el archivo es UTF-8 válido; si no, 'cp1252' (el "CSV" de Excel en Windows)"""
+    decodificador = codecs.getincrementaldecoder('utf-8')()
+    with open(ruta, 'rb') as f:
+        try:
+            for bloque in iter(lambda: f.read(65536), b''):
+                decodificador.decode(bloque)
+            decodificador.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return 'cp1252'
+    return 'utf-8-sig'
+
+
+def leer_filas_csv(ruta):
+    """Filas de un CSV; detecta si el separador es coma, punto y coma o tabulador"""
+    # utf-8-sig para aceptar el BOM que agrega Excel al guardar como CSV UTF-8
+    with open(ruta, newline='', encoding=codificacion_csv(ruta)) as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(f, dialecto)
+
+
+def leer_filas_xlsx(ruta):
+    """Filas de la primera hoja; en modo de solo lectura openpyxl no carga el libro completo"""
+    # openpyxl solo se carga si de verdad se importa un Excel
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_renglones(ruta, campos):
+    """Renglones {campo: texto} del archivo
+
+    La primera fila es el encabezado si tiene una columna 'nombre' (sin importar
+    mayúsculas ni acentos); si no, el archivo es una lista simple de nombres en
+    la primera columna.
+    """
+    filas = leer_filas_csv(ruta) if ruta.lower().endswith('.csv') else leer_filas_xlsx(ruta)
+    encabezado = next(filas, None)
+    if encabezado is None:
+        return
+
+    columnas = {}
+    for posicion, titulo in enumerate(encabezado):
+        columnas.setdefault(normalizar(texto_celda(titulo)), posicion)
+    if 'nombre' in columnas:
+        posiciones = {campo: columnas.get(campo) for campo in campos}
+    else:
+        posiciones = {campo: 0 if campo == 'nombre' else None for campo in campos}
+        filas = itertools.chain([encabezado], filas)
+
+    for fila in filas:
+        yield {campo: texto_celda(fila[posicion]) if posicion is not None and posicion < len(fila) else ''
+               for campo, posicion in posiciones.items()}
@@ -0,0 +1,489 @@
+"""Índices en memoria sobre los datos del sistema de préstamos"""
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+# Colección de inventario donde vive cada categoría de equipo
+COLECCION_POR_CATEGORIA = {
+    'Computadora': 'equipos',
+    'Controles': 'controles',
+    'Cable': 'cables',
+    'Audifonos': 'audifonos',
+}
+
+CATEGORIA_POR_COLECCION = {coleccion: categoria for categoria, coleccion in COLECCION_POR_CATEGORIA.items()}
+
+
+def categoria_de(coleccion, item):
+    """Categoría de un artículo; en equipos cada registro trae la suya"""
+    if coleccion == 'equipos':
+        return item.get('categoria', 'Computadora')
+    return CATEGORIA_POR_COLECCION[coleccion]
+
+
+def etiqueta(coleccion, item):
+    """Texto con el que se muestra un artículo en las listas desplegables"""
+    return f"{item['nombre']} ({categoria_de(coleccion, item)})"
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos, para comparar nombres"""
+    descompuesto = unicodedata.normalize('NFD', texto.casefold())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def trigramas(texto):
+    """Conjunto de subcadenas de tres caracteres de un texto"""
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def texto_de(valor):
+    """Texto buscable de un campo; de una lista de artículos, sus nombres"""
+    if isinstance(valor, list):
+        return ' '.join(articulo.get('nombre') or '' for articulo in valor)
+    return valor
+
+
+@lru_cache(maxsize=8192)
+def palabras(texto):
+    """Palabras normalizadas de un texto (los nombres se repiten mucho, se memorizan)"""
+    return frozenset(re.findall(r'\w+', normalizar(texto or '')))
+
+
+class Coleccion:
+    """Registros indexados por id, con contador persistente para asignar ids nuevos
+
+    cambiada queda en True al agregar, quitar o reservar un id, hasta que el
+    motor la escribe; así una transacción fallida sabe qué volver a leer.
+    """
+
+    cambiada = False
+
+    def __init__(self, registros=(), siguiente_id=1):
+        self.por_id = {r['id']: r for r in registros}
+        self.siguiente_id = max(siguiente_id, max(self.por_id, default=0) + 1)
+
+    def __iter__(self):
+        return iter(self.por_id.values())
+
+    def __len__(self):
+        return len(self.por_id)
+
+    def obtener(self, registro_id):
+        """Registro por id, o None"""
+        return self.por_id.get(registro_id)
+
+    def nuevo_id(self):
+        """Reservar el siguiente id (los ids eliminados no se reutilizan)"""
+        registro_id = self.siguiente_id
+        self.siguiente_id += 1
+        self.cambiada = True
+        return registro_id
+
+    def agregar(self, registro):
+        """Agregar un registro al final"""
+        self.cambiada = True
+        self.por_id[registro['id']] = registro
+
+    def eliminar(self, registro_id):
+        """Quitar un registro por id y devolverlo"""
+        self.cambiada = True
+        return self.por_id.pop(registro_id, None)
+
+
+class IndiceInventario:
+    """Acceso directo a los artículos por etiqueta, por (categoría, id) y por nombre
+
+    disponibles guarda (coleccion, id) de los artículos con estado Disponible;
+    los cambios de estado pasan por marcar() para mantenerlo al día.
+    """
+
+    def __init__(self):
+        self.por_etiqueta = {}
+        self.por_clave = {}
+        self.por_nombre = {}
+        self.disponibles = set()
+
+    def reconstruir(self, colecciones):
+        """Construir los índices a partir de {coleccion: lista de artículos}"""
+        self.por_etiqueta.clear()
+        self.por_clave.clear()
+        self.por_nombre.clear()
+        self.disponibles.clear()
+        for coleccion, items in colecciones.items():
+            for item in items:
+                self.agregar(coleccion, item)
+
+    def agregar(self, coleccion, item):
+        """Indexar un artículo (si hay nombres repetidos se conserva el primero)"""
+        self.por_etiqueta.setdefault(etiqueta(coleccion, item), (coleccion, item))
+        self.por_clave.setdefault((categoria_de(coleccion, item), item['id']), item)
+        self.por_nombre.setdefault((coleccion, item['nombre']), item)
+        if item.get('estado', 'Disponible') == 'Disponible':
+            self.disponibles.add((coleccion, item['id']))
+
+    def quitar(self, coleccion, item):
+        """Quitar un artículo de los índices"""
+        if self.por_etiqueta.get(etiqueta(coleccion, item), (None, None))[1] is item:
+            del self.por_etiqueta[etiqueta(coleccion, item)]
+        for indice, clave in ((self.por_clave, (categoria_de(coleccion, item), item['id'])),
+                              (self.por_nombre, (coleccion, item['nombre']))):
+            if indice.get(clave) is item:
+                del indice[clave]
+        self.disponibles.discard((coleccion, item['id']))
+
+    def marcar(self, coleccion, item, estado):
+        """Cambiar el estado de un artículo (Disponible o Prestado)"""
+        item['estado'] = estado
+        if estado == 'Disponible':
+            self.disponibles.add((coleccion, item['id']))
+        else:
+            self.disponibles.discard((coleccion, item['id']))
+
+    def no_disponibles(self, articulos):
+        """De una lista de (coleccion, artículo), los que no están disponibles"""
+        return [(coleccion, item) for coleccion, item in articulos
+                if (coleccion, item['id']) not in self.disponibles]
+
+    def buscar_etiqueta(self, texto):
+        """(coleccion, artículo) cuya etiqueta es exactamente el texto, o (None, None)"""
+        return self.por_etiqueta.get(texto, (None, None))
+
+    def buscar_id(self, categoria, item_id):
+        """Artículo por categoría e id, o None"""
+        return self.por_clave.get((categoria, item_id))
+
+    def buscar_nombre(self, coleccion, nombre):
+        """Artículo de una colección por nombre, o None"""
+        return self.por_nombre.get((coleccion, nombre))
+
+
+class IndiceNombres:
+    """Búsqueda de nombres por subcadena (trigramas) o por inicio de palabra, sin acentos"""
+
+    def __init__(self):
+        self.normalizados = {}
+        self.por_nombre = {}
+        self.por_trigrama = defaultdict(set)
+        self.por_prefijo = defaultdict(set)
+
+    def reconstruir(self, registros):
+        """Indexar todos los registros {'id', 'nombre'}"""
+        self.normalizados.clear()
+        self.por_nombre.clear()
+        self.por_trigrama.clear()
+        self.por_prefijo.clear()
+        for registro in registros:
+            self.agregar(registro)
+
+    def claves(self, normalizado):
+        """Trigramas y prefijos cortos (1-2 letras) de cada palabra"""
+        prefijos = {palabra[:n] for palabra in normalizado.split() for n in (1, 2)}
+        return trigramas(normalizado), prefijos
+
+    def agregar(self, registro):
+        """Indexar un registro"""
+        normalizado = normalizar(registro['nombre'])
+        self.normalizados[registro['id']] = (registro['nombre'], normalizado)
+        self.por_nombre.setdefault(registro['nombre'], registro['id'])
+        tris, prefijos = self.claves(normalizado)
+        for tri in tris:
+            self.por_trigrama[tri].add(registro['id'])
+        for prefijo in prefijos:
+            self.por_prefijo[prefijo].add(registro['id'])
+
+    def quitar(self, registro_id):
+        """Quitar un registro del índice"""
+        nombre, normalizado = self.normalizados.pop(registro_id, (None, ''))
+        if self.por_nombre.get(nombre) == registro_id:
+            del self.por_nombre[nombre]
+        tris, prefijos = self.claves(normalizado)
+        for tri in tris:
+            self.por_trigrama[tri].discard(registro_id)
+        for prefijo in prefijos:
+            self.por_prefijo[prefijo].discard(registro_id)
+
+    def contiene(self, nombre):
+        """Indica si existe un registro con exactamente ese nombre"""
+        return nombre in self.por_nombre
+
+    def id_de(self, nombre):
+        """Id del registro con exactamente ese nombre, o None"""
+        return self.por_nombre.get(nombre)
+
+    def buscar(self, texto):
+        """Nombres que contienen el texto (o con palabras que empiezan así si es corto), en orden de id"""
+        consulta = normalizar(texto).strip()
+        if not consulta:
+            return []
+
+        if len(consulta) < 3:
+            candidatos = self.por_prefijo.get(consulta, set())
+        else:
+            # Intersección empezando por el trigrama menos frecuente
+            conjuntos = sorted((self.por_trigrama.get(t, set()) for t in trigramas(consulta)), key=len)
+            candidatos = set(conjuntos[0]).intersection(*conjuntos[1:])
+            # Los trigramas no garantizan el orden: confirmar la subcadena
+            candidatos = {i for i in candidatos if consulta in self.normalizados[i][1]}
+
+        return [self.normalizados[i][0] for i in sorted(candidatos)]
+
+
+# Campos de texto de un préstamo que entran al índice invertido
+CAMPOS_TEXTO_PRESTAMO = ('usuario', 'prestamista', 'articulos', 'quien_recibe', 'observaciones',
+                         'observaciones_finales')
+
+
+class IndicePrestamos:
+    """Índice invertido por palabra y campo, por estado y por fechas para consultar préstamos
+
+    Las fechas se guardan como texto "%Y-%m-%d %H:%M", que ordena igual que el
+    tiempo, así que los índices de fechas son listas ordenadas de (fecha, id).
+    """
+
+    def __init__(self):
+        self.por_palabra = defaultdict(set)
+        self.vocabulario = []
+        self.por_estado = defaultdict(set)
+        self.fechas = {'fecha_prestamo': [], 'fecha_entrega': []}
+        self.indexado = {}
+
+    def reconstruir(self, prestamos):
+        """Indexar todos los préstamos (las listas ordenadas se ordenan una sola vez)"""
+        self.__init__()
+        for prestamo in prestamos:
+            self.indexar(prestamo, ordenado=False)
+        self.vocabulario = sorted((palabra, campo) for campo, palabra in self.por_palabra)
+        for lista in self.fechas.values():
+            lista.sort()
+
+    def agregar(self, prestamo):
+        """Indexar un préstamo (si ya estaba, se reemplaza)"""
+        self.quitar(prestamo['id'])
+        self.indexar(prestamo, ordenado=True)
+
+    def indexar(self, prestamo, ordenado):
+        """Agregar un préstamo a los índices; ordenado=False deja las listas sin ordenar"""
+        claves = {(campo, palabra)
+                  for campo in CAMPOS_TEXTO_PRESTAMO
+                  for palabra in palabras(texto_de(prestamo.get(campo)))}
+        for clave in claves:
+            if ordenado and clave not in self.por_palabra:
+                bisect.insort(self.vocabulario, (clave[1], clave[0]))
+            self.por_palabra[clave].add(prestamo['id'])
+
+        fechas = {campo: prestamo.get(campo) for campo in self.fechas if prestamo.get(campo)}
+        for campo, fecha in fechas.items():
+            if ordenado:
+                bisect.insort(self.fechas[campo], (fecha, prestamo['id']))
+            else:
+                self.fechas[campo].append((fecha, prestamo['id']))
+
+        self.por_estado[prestamo['estado']].add(prestamo['id'])
+        self.indexado[prestamo['id']] = (claves, prestamo['estado'], fechas)
+
+    def quitar(self, prestamo_id):
+        """Quitar un préstamo de los índices"""
+        if prestamo_id not in self.indexado:
+            return
+        claves, estado, fechas = self.indexado.pop(prestamo_id)
+        for clave in claves:
+            ids = self.por_palabra[clave]
+            ids.discard(prestamo_id)
+            if not ids:
+                del self.por_palabra[clave]
+                del self.vocabulario[bisect.bisect_left(self.vocabulario, (clave[1], clave[0]))]
+        self.por_estado[estado].discard(prestamo_id)
+        for campo, fecha in fechas.items():
+            lista = self.fechas[campo]
+            del lista[bisect.bisect_left(lista, (fecha, prestamo_id))]
+
+    def buscar_palabra(self, prefijo, campos):
+        """Ids con alguna palabra que empieza con el prefijo en alguno de los campos"""
+        ids = set()
+        inicio = bisect.bisect_left(self.vocabulario, (prefijo, ''))
+        for palabra, campo in self.vocabulario[inicio:]:
+            if not palabra.startswith(prefijo):
+                break
+            if campo in campos:
+                ids |= self.por_palabra[(campo, palabra)]
+        return ids
+
+    def rango_fechas(self, campo, desde=None, hasta=None):
+        """Ids con la fecha del campo dentro de [desde, hasta]"""
+        lista = self.fechas[campo]
+        inicio = bisect.bisect_left(lista, (desde, 0)) if desde else 0
+        fin = bisect.bisect_right(lista, (hasta, float('inf'))) if hasta else len(lista)
+        return {prestamo_id for _, prestamo_id in lista[inicio:fin]}
+
+    def consultar(self, texto='', campos=CAMPOS_TEXTO_PRESTAMO, estado=None,
+                  campo_fecha='fecha_prestamo', desde=None, hasta=None):
+        """Ids (ordenados) que cumplen todos los filtros dados; None si no hay filtros"""
+        conjuntos = []
+        for palabra in palabras(texto):
+            conjuntos.append(self.buscar_palabra(palabra, campos))
+        if estado:
+            conjuntos.append(self.por_estado.get(estado, set()))
+        if desde or hasta:
+            conjuntos.append(self.rango_fechas(campo_fecha, desde, hasta))
+
+        if not conjuntos:
+            return None
+        conjuntos.sort(key=len)
+        return sorted(conjuntos[0].intersection(*conjuntos[1:]))
+
+
+class IndiceTemporal:
+    """Préstamos ordenados por fecha de préstamo, con un árbol de segmentos del máximo de fecha de entrega
+
+    Permite preguntar qué estuvo prestado en un momento o periodo visitando solo
+    las ramas donde algún préstamo seguía fuera, O(log n) por resultado.
+    """
+
+    # Fecha de entrega de los préstamos que siguen fuera
+    PENDIENTE = '9999-12-31 23:59'
+
+    def __init__(self):
+        self.inicios = []
+        self.fines = []
+        self.posicion = {}
+        self.capacidad = 1
+        self.arbol = ['', '']
+
+    def fin(self, prestamo):
+        """Fecha en que el préstamo dejó de estar fuera"""
+        return prestamo.get('fecha_entrega') or self.PENDIENTE
+
+    def reconstruir(self, prestamos):
+        """Ordenar todos los préstamos y construir el árbol"""
+        pares = sorted(((p['fecha_prestamo'], p['id']), self.fin(p)) for p in prestamos)
+        self.inicios = [inicio for inicio, _ in pares]
+        self.fines = [fin for _, fin in pares]
+        self.posicion = {prestamo_id: pos for pos, (_, prestamo_id) in enumerate(self.inicios)}
+        self.construir_arbol()
+
+    def construir_arbol(self):
+        """Árbol de segmentos (arreglo) con el máximo de fines de cada tramo"""
+        self.capacidad = 1
+        while self.capacidad < len(self.fines):
+            self.capacidad *= 2
+        self.arbol = [''] * (2 * self.capacidad)
+        self.arbol[self.capacidad:self.capacidad + len(self.fines)] = self.fines
+        for nodo in range(self.capacidad - 1, 0, -1):
+            self.arbol[nodo] = max(self.arbol[2 * nodo], self.arbol[2 * nodo + 1])
+
+    def actualizar_hoja(self, pos):
+        """Propagar hacia la raíz el fin de una posición"""
+        nodo = pos + self.capacidad
+        self.arbol[nodo] = self.fines[pos]
+        nodo //= 2
+        while nodo:
+            self.arbol[nodo] = max(self.arbol[2 * nodo], self.arbol[2 * nodo + 1])
+            nodo //= 2
+
+    def agregar(self, prestamo):
+        """Indexar un préstamo nuevo o actualizar su fecha de entrega"""
+        pos = self.posicion.get(prestamo['id'])
+        if pos is not None:
+            self.fines[pos] = self.fin(prestamo)
+            self.actualizar_hoja(pos)
+            return
+
+        clave = (prestamo['fecha_prestamo'], prestamo['id'])
+        if self.inicios and clave < self.inicios[-1]:
+            # Fuera de orden (poco común): reconstruir con el préstamo en su lugar
+            pos = bisect.bisect_left(self.inicios, clave)
+            self.inicios.insert(pos, clave)
+            self.fines.insert(pos, self.fin(prestamo))
+            self.posicion = {prestamo_id: p for p, (_, prestamo_id) in enumerate(self.inicios)}
+            self.construir_arbol()
+            return
+
+        # Lo normal: el préstamo más reciente va al final
+        self.inicios.append(clave)
+        self.fines.append(self.fin(prestamo))
+        self.posicion[prestamo['id']] = len(self.inicios) - 1
+        if len(self.fines) > self.capacidad:
+            self.construir_arbol()
+        else:
+            self.actualizar_hoja(len(self.fines) - 1)
+
+    def quitar(self, prestamo_id):
+        """Excluir un préstamo de las consultas (queda como hueco hasta reconstruir)"""
+        pos = self.posicion.pop(prestamo_id, None)
+        if pos is not None:
+            self.fines[pos] = ''
+            self.actualizar_hoja(pos)
+
+    def vigentes(self, desde, hasta):
+        """Ids de préstamos fuera en algún momento de [desde, hasta], por fecha de préstamo
+
+        Un préstamo cuenta si salió a más tardar en hasta y no se había
+        entregado al llegar desde; con desde == hasta es "qué estaba prestado
+        en ese momento".
+        """
+        limite = bisect.bisect_right(self.inicios, (hasta, float('inf')))
+        posiciones = []
+        pendientes = [(1, 0, self.capacidad)]
+        while pendientes:
+            nodo, izquierda, derecha = pendientes.pop()
+            if izquierda >= limite or self.arbol[nodo] <= desde:
+                continue
+            if derecha - izquierda == 1:
+                posiciones.append(izquierda)
+                continue
+            mitad = (izquierda + derecha) // 2
+            pendientes.append((2 * nodo + 1, mitad, derecha))
+            pendientes.append((2 * nodo, izquierda, mitad))
+        return [self.inicios[pos][1] for pos in posiciones]
+
+
+class AgendaVencimientos:
+    """Montículo de préstamos pendientes ordenado por fecha límite
+
+    Cada revisión solo saca del montículo lo que ya venció; las entradas de
+    préstamos entregados o reprogramados se descartan al salir.
+    """
+
+    def __init__(self):
+        self.monticulo = []
+        self.limites = {}
+        self.vencidos = set()
+
+    def reconstruir(self, pendientes):
+        """Agendar de una vez pares (id, fecha límite)"""
+        self.limites = dict(pendientes)
+        self.vencidos = set()
+        self.monticulo = [(limite, prestamo_id) for prestamo_id, limite in self.limites.items()]
+        heapq.heapify(self.monticulo)
+
+    def agregar(self, prestamo_id, limite):
+        """Agendar un préstamo o cambiar su fecha límite"""
+        if self.limites.get(prestamo_id) == limite:
+            return
+        self.limites[prestamo_id] = limite
+        self.vencidos.discard(prestamo_id)
+        heapq.heappush(self.monticulo, (limite, prestamo_id))
+
+    def quitar(self, prestamo_id):
+        """Sacar de la agenda un préstamo entregado o eliminado"""
+        self.limites.pop(prestamo_id, None)
+        self.vencidos.discard(prestamo_id)
+        if len(self.monticulo) > 2 * len(self.limites) + 64:
+            # Demasiadas entradas obsoletas: rehacer el montículo
+            vencidos = self.vencidos
+            self.reconstruir(self.limites.items())
+            self.vencidos = vencidos
+
+    def vencer(self, ahora):
+        """Ids de préstamos que vencieron desde la revisión anterior"""
+        nuevos = []
+        while self.monticulo and self.monticulo[0][0] < ahora:
+            limite, prestamo_id = heapq.heappop(self.monticulo)
+            if self.limites.get(prestamo_id) == limite and prestamo_id not in self.vencidos:
+                self.vencidos.add(prestamo_id)
+                nuevos.append(prestamo_id)
+        return nuevos
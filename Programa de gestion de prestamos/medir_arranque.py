@@ -0,0 +1,48 @@
+"""Medir cuánto tarda en abrir la ventana y comprobar qué bibliotecas pesadas se cargaron
+
+Uso: python medir_arranque.py [repeticiones]
+Cada medición corre en un proceso nuevo para que no se reutilicen módulos ya importados.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Bibliotecas que solo deben cargarse al exportar o importar
+PESADAS = ('pandas', 'openpyxl', 'exportacion', 'importacion')
+
+MEDICION = r'''
+import importlib.util, json, sys, time
+inicio = time.perf_counter()
+spec = importlib.util.spec_from_file_location('gestion', sys.argv[1])
+modulo = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(modulo)
+app = modulo.SistemaPrestamos()
+app.root.update()
+segundos = time.perf_counter() - inicio
+cargadas = [m for m in json.loads(sys.argv[2]) if m in sys.modules]
+app.root.destroy()
+print(json.dumps({'segundos': segundos, 'cargadas': cargadas}))
+'''
+
+
+def medir():
+    """Abrir la aplicación en un proceso aparte y devolver (segundos, módulos pesados cargados)"""
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Gestion de Prestamos.py')
+    salida = subprocess.run([sys.executable, '-c', MEDICION, ruta, json.dumps(PESADAS)],
+                            capture_output=True, text=True, check=True).stdout
+    resultado = json.loads(salida.strip().splitlines()[-1])
+    return resultado['segundos'], resultado['cargadas']
+
+
+if __name__ == '__main__':
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    tiempos = []
+    for _ in range(repeticiones):
+        segundos, cargadas = medir()
+        if cargadas:
+            sys.exit(f"Se importaron al arrancar: {', '.join(cargadas)}")
+        tiempos.append(segundos)
+    print(f"Ventana lista en {statistics.median(tiempos) * 1000:.0f} ms (mediana de {repeticiones}); "
+          f"sin {', '.join(PESADAS)}")
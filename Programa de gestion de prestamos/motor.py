@@ -0,0 +1,873 @@
+"""Motor del sistema de préstamos: datos, índices, persistencia y operaciones, sin interfaz
+
+La ventana de Tk (Gestion de Prestamos.py) y el servidor HTTP (servidor.py) usan
+esta misma clase; aquí no se lee ningún widget ni se muestra ningún mensaje.
+Los errores de validación se avisan con ErrorPrestamo.
+
+Varias estaciones pueden compartir la carpeta de datos: cada operación que
+modifica datos es una transacción que toma el candado de la carpeta, vuelve a
+leer las colecciones que otra estación guardó (según su versión) y escribe sus
+cambios antes de soltarlo. Por eso la escritura es síncrona: quien llama espera
+el disco (y, a lo sumo ESPERA_CANDADO segundos, a las demás estaciones).
+"""
+import json
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from persistencia import COLECCIONES, CacheInstantanea, CandadoDatos, crear_almacen, escribir_lote
+from indices import (CATEGORIA_POR_COLECCION, COLECCION_POR_CATEGORIA, CAMPOS_TEXTO_PRESTAMO, AgendaVencimientos,
+                     Coleccion, IndiceInventario, IndiceNombres, IndicePrestamos, IndiceTemporal, normalizar)
+from registros import CLASE_POR_COLECCION, Articulo, Prestamo
+
+# Campos del préstamo donde busca cada tipo de búsqueda
+CAMPOS_POR_TIPO_BUSQUEDA = {
+    'Todos': CAMPOS_TEXTO_PRESTAMO,
+    'Usuario': ('usuario',),
+    'Prestamista': ('prestamista',),
+    'Equipo': ('articulos',),
+    'Quien Recibe': ('quien_recibe',),
+    'Observaciones': ('observaciones', 'observaciones_finales'),
+}
+
+# Duración por defecto de un préstamo según la categoría de lo prestado
+DURACION_POR_CATEGORIA = {
+    'Computadora': timedelta(hours=8),
+    'Controles': timedelta(hours=8),
+    'Cable': timedelta(days=1),
+    'Audifonos': timedelta(hours=8),
+}
+DURACION_PRESTAMO = timedelta(days=1)
+
+# Atributos que se guardan en la instantánea de arranque: colecciones e índices ya construidos
+ATRIBUTOS_INSTANTANEA = COLECCIONES + ('inventario', 'indice_usuarios', 'indice_prestamistas',
+                                       'indice_prestamos', 'indice_temporal', 'vencimientos')
+
+# Colecciones del inventario, en el orden de las columnas de prestamos_tree
+COLECCIONES_INVENTARIO = ('equipos', 'controles', 'cables', 'audifonos')
+
+# Campo con que los préstamos anteriores referenciaban cada colección (un artículo por campo)
+CAMPO_PRESTAMO_POR_COLECCION = {
+    'equipos': 'equipo',
+    'controles': 'controles',
+    'cables': 'cables',
+    'audifonos': 'audifonos',
+}
+
+# Colección referenciada por cada campo del préstamo (el id va en campo + '_id')
+COLECCION_POR_CAMPO = {
+    'usuario': 'usuarios',
+    'prestamista': 'prestamistas',
+}
+
+# Tipo con que se guarda cada registro de personas
+TIPO_POR_COLECCION = {
+    'usuarios': 'Usuario',
+    'prestamistas': 'Prestamista',
+}
+
+# Formas en que puede venir escrita cada categoría en un archivo importado (singular o plural,
+# como la guardan los JSON y las hojas exportadas)
+NOMBRES_CATEGORIA = {
+    'Computadora': ('Computadora', 'Computadoras', 'Equipo', 'Equipos'),
+    'Controles': ('Control', 'Controles'),
+    'Cable': ('Cable', 'Cables'),
+    'Audifonos': ('Audífono', 'Audífonos'),
+}
+
+# Categoría de inventario según el texto ya normalizado
+CATEGORIA_POR_TEXTO = {normalizar(texto): categoria
+                       for categoria, textos in NOMBRES_CATEGORIA.items() for texto in textos}
+
+
+class ErrorPrestamo(Exception):
+    """Operación rechazada por los datos (campo vacío, equipo ocupado, préstamos activos...)"""
+
+
+class NoEncontrado(ErrorPrestamo):
+    """El registro pedido no existe"""
+
+
+class DatosOcupados(ErrorPrestamo):
+    """Otra estación retiene la carpeta de datos más de lo que se espera el candado"""
+
+
+def transaccional(metodo):
+    """Ejecutar una operación del motor dentro de una transacción"""
+    def envoltura(self, *args, **kwargs):
+        with self.transaccion():
+            return self.en_memoria(lambda: metodo(self, *args, **kwargs))
+    envoltura.__doc__ = metodo.__doc__
+    return envoltura
+
+
+def escritas_en(lote):
+    """Colecciones (y secuencias) que escribe un lote de guardado"""
+    escritas = set(lote['colecciones'])
+    if lote['eventos']:
+        escritas.add('prestamos')
+    if lote['secuencias'] is not None:
+        escritas.add('secuencias')
+    return escritas
+
+
+class MotorPrestamos:
+    """Colecciones, índices y operaciones del sistema de préstamos"""
+
+    def __init__(self, base_dir):
+        # Carpeta de los archivos de datos
+        self.base_dir = base_dir
+
+        # Datos del sistema: cada colección indexada por id
+        for nombre in COLECCIONES:
+            setattr(self, nombre, Coleccion())
+
+        # Persistencia: solo se reescriben las colecciones modificadas
+        self.almacen = crear_almacen(self.base_dir)
+        self.instantanea = CacheInstantanea(self.almacen)
+        self.colecciones_modificadas = set()
+        self.eventos_prestamos = []
+        self.observaciones_pendientes = []
+
+        # Acceso compartido: candado de la carpeta y versión leída de cada colección
+        # (None mientras no se hayan leído todos los datos)
+        self.candado = CandadoDatos(self.base_dir)
+        self.versiones = None
+        self.en_transaccion = False
+
+        # Fecha y tamaño de los archivos de datos la última vez que se leyeron o escribieron
+        self.firma_archivos = None
+
+        # Registros cambiados desde el último refresco de cada lista {coleccion: ids}
+        self.cambios_pendientes = defaultdict(set)
+
+        # Índices del inventario por etiqueta, (categoría, id) y nombre
+        self.inventario = IndiceInventario()
+
+        # Índices de nombres para el autocompletado
+        self.indice_usuarios = IndiceNombres()
+        self.indice_prestamistas = IndiceNombres()
+
+        # Índice de préstamos para las búsquedas de reportes
+        self.indice_prestamos = IndicePrestamos()
+        self.indice_temporal = IndiceTemporal()
+
+        # Préstamos pendientes por fecha límite
+        self.vencimientos = AgendaVencimientos()
+
+        # Cargar datos existentes
+        self.cargar_datos()
+
+    def cargar_datos(self):
+        """Cargar datos desde archivos JSON (o desde prestamos.db si existe)"""
+        with self.carpeta_tomada():
+            self.leer_datos()
+            if self.colecciones_modificadas:
+                # La carga migró datos de una versión anterior
+                self.escribir_pendiente()
+
+    def en_memoria(self, funcion, *args):
+        """Ejecutar una parte que cambia los datos en memoria
+
+        Sin interfaz se ejecuta aquí mismo; la ventana de Tk la pasa a su hilo
+        para no leer nunca una colección a medio cambiar.
+        """
+        return funcion(*args)
+
+    def leer_colecciones(self, nombres):
+        """Registros guardados de las colecciones indicadas, más las secuencias (solo lee el disco)"""
+        datos = {'secuencias': self.almacen.cargar_secuencias()}
+        for nombre in COLECCIONES:
+            if nombre in nombres:
+                datos[nombre] = list(self.almacen.cargar(nombre))
+        return datos
+
+    def leer_datos(self):
+        """Leer todas las colecciones (o la instantánea) y construir los índices"""
+        # Si la lectura falla a medias los datos siguen sin cargar y nada se escribe encima
+        self.versiones = None
+        versiones = self.almacen.cargar_versiones()
+        firma = self.instantanea.firma()
+
+        # Si los archivos no cambiaron desde el último cierre, basta una lectura
+        estado = self.instantanea.cargar()
+        datos = self.leer_colecciones(COLECCIONES) if estado is None else None
+        self.en_memoria(self.construir_datos, estado, datos)
+        self.versiones = versiones
+        self.firma_archivos = firma
+
+    def construir_datos(self, estado, datos):
+        """Reemplazar los datos en memoria por la instantánea o por los registros leídos"""
+        self.colecciones_modificadas.clear()
+        self.eventos_prestamos.clear()
+        self.observaciones_pendientes = []
+        self.cambios_pendientes.clear()
+
+        if estado is not None:
+            for atributo in ATRIBUTOS_INSTANTANEA:
+                setattr(self, atributo, estado[atributo])
+            return
+
+        for nombre in COLECCIONES:
+            # Préstamos y artículos se guardan en memoria como registros compactos
+            clase = CLASE_POR_COLECCION.get(nombre, dict)
+            setattr(self, nombre, Coleccion(map(clase, datos[nombre]), datos['secuencias'].get(nombre, 1)))
+
+        self.inventario.reconstruir({c: getattr(self, c) for c in COLECCIONES_INVENTARIO})
+        self.indice_usuarios.reconstruir(self.usuarios)
+        self.indice_prestamistas.reconstruir(self.prestamistas)
+        self.migrar_referencias()
+        self.indice_prestamos.reconstruir(self.prestamos)
+        self.indice_temporal.reconstruir(self.prestamos)
+        self.reconstruir_vencimientos()
+
+    def reconstruir_vencimientos(self):
+        """Volver a armar la agenda de préstamos pendientes y marcar de nuevo los ya vencidos"""
+        self.vencimientos.reconstruir(
+            (p['id'], self.fecha_limite(p)) for p in self.prestamos if p['estado'] == 'Prestado')
+        # La agenda nueva no trae vencidos: sin esto se pierden hasta la siguiente revisión
+        self.actualizar_vencidos()
+
+    def recargar(self, nombres, datos):
+        """Reemplazar las colecciones indicadas por las leídas (leer_colecciones) y sus índices"""
+        secuencias = datos['secuencias']
+        for nombre in COLECCIONES:
+            if nombre in nombres:
+                anteriores = getattr(self, nombre).por_id
+                clase = CLASE_POR_COLECCION.get(nombre, dict)
+                setattr(self, nombre, Coleccion(map(clase, datos[nombre]), secuencias.get(nombre, 1)))
+                # Solo altas, bajas y registros distintos, para refrescar únicamente esos renglones
+                nuevos = getattr(self, nombre).por_id
+                self.cambios_pendientes[nombre].update(
+                    i for i in anteriores.keys() | nuevos.keys()
+                    if i not in anteriores or i not in nuevos or dict(anteriores[i]) != dict(nuevos[i]))
+            coleccion = getattr(self, nombre)
+            if 'secuencias' in nombres:
+                # Manda lo guardado: los ids reservados por un cambio descartado se vuelven a usar
+                coleccion.siguiente_id = max(secuencias.get(nombre, 1), max(coleccion.por_id, default=0) + 1)
+            else:
+                coleccion.siguiente_id = max(coleccion.siguiente_id, secuencias.get(nombre, 1))
+
+        if nombres & set(COLECCIONES_INVENTARIO):
+            self.inventario.reconstruir({c: getattr(self, c) for c in COLECCIONES_INVENTARIO})
+        if 'usuarios' in nombres:
+            self.indice_usuarios.reconstruir(self.usuarios)
+        if 'prestamistas' in nombres:
+            self.indice_prestamistas.reconstruir(self.prestamistas)
+        if 'prestamos' in nombres:
+            self.migrar_referencias()
+            self.indice_prestamos.reconstruir(self.prestamos)
+            self.indice_temporal.reconstruir(self.prestamos)
+            self.reconstruir_vencimientos()
+
+        vistas = {'prestamos': 'prestamos', 'usuarios': 'usuarios', 'prestamistas': 'usuarios',
+                  **{c: 'equipos' for c in COLECCIONES_INVENTARIO}}
+        self.programar_refresco('desplegables', *{vistas[n] for n in nombres if n in vistas})
+
+    def leer_cambios_externos(self, releer=()):
+        """Recargar lo que otras estaciones guardaron desde la última lectura (con el candado tomado)
+
+        Las colecciones de releer se vuelven a leer aunque su versión no haya cambiado.
+        Si la carga inicial no se completó (por ejemplo, otra estación retenía el
+        candado al arrancar) se leen todos los datos.
+        """
+        if self.versiones is None:
+            return self.leer_todo()
+
+        en_disco = self.almacen.cargar_versiones()
+        cambiadas = set(releer) | {nombre for nombre in en_disco.keys() | self.versiones.keys()
+                                   if en_disco.get(nombre) != self.versiones.get(nombre)}
+        if cambiadas:
+            datos = self.leer_colecciones(cambiadas)
+            self.en_memoria(self.recargar, cambiadas, datos)
+            self.versiones = en_disco
+        self.firma_archivos = self.instantanea.firma()
+        return cambiadas
+
+    def leer_todo(self):
+        """Leer todos los datos en lugar de solo las colecciones que cambiaron; refresca todas las vistas"""
+        anteriores = {nombre: set(getattr(self, nombre).por_id) for nombre in COLECCIONES}
+        self.leer_datos()
+        self.en_memoria(self.marcar_todo_cambiado, anteriores)
+        if self.colecciones_modificadas and not self.en_transaccion:
+            # La carga migró datos de una versión anterior
+            self.escribir_pendiente()
+        return set(COLECCIONES)
+
+    def marcar_todo_cambiado(self, anteriores):
+        """Refrescar todas las vistas: cada registro anterior o nuevo cuenta como cambiado"""
+        for nombre in COLECCIONES:
+            self.cambios_pendientes[nombre].update(anteriores[nombre] | getattr(self, nombre).por_id.keys())
+        self.programar_refresco('prestamos', 'equipos', 'usuarios', 'desplegables')
+
+    def sincronizar(self):
+        """Traer los cambios de otras estaciones; devuelve las colecciones que cambiaron"""
+        if self.en_transaccion:
+            return self.leer_cambios_externos()
+        with self.carpeta_tomada():
+            return self.leer_cambios_externos()
+
+    def revisar_archivos(self):
+        """Sincronizar solo si algún archivo de datos cambió desde la última lectura o escritura
+
+        Basta consultar fecha y tamaño de los archivos, sin abrirlos ni tomar el candado.
+        """
+        if self.instantanea.firma() == self.firma_archivos:
+            return set()
+        return self.sincronizar()
+
+    @contextmanager
+    def carpeta_tomada(self):
+        """Candado de la carpeta de datos; DatosOcupados si no se obtiene a tiempo"""
+        try:
+            self.candado.tomar()
+        except TimeoutError as e:
+            raise DatosOcupados(str(e)) from None
+        try:
+            yield
+        finally:
+            self.candado.soltar()
+
+    @contextmanager
+    def transaccion(self):
+        """Candado de la carpeta de datos, datos al día al empezar y todo escrito al terminar
+
+        Las transacciones anidadas forman parte de la exterior. Si la operación
+        falla a medias, lo que alcanzó a cambiar en memoria se vuelve a leer de disco.
+        """
+        if self.en_transaccion:
+            yield
+            return
+        with self.carpeta_tomada():
+            self.en_transaccion = True
+            try:
+                # Validar contra lo último guardado: evita prestar dos veces el mismo equipo
+                self.leer_cambios_externos()
+                try:
+                    yield
+                except BaseException:
+                    # Sin esto, lo cambiado antes del error se escribiría en la siguiente transacción
+                    self.volver_a_lo_guardado(self.cambiadas_en_memoria())
+                    raise
+                self.escribir_pendiente()
+            finally:
+                self.en_transaccion = False
+
+    def cambiadas_en_memoria(self):
+        """Colecciones con cambios aún sin escribir, se hayan marcado ya o no"""
+        nombres = set(self.colecciones_modificadas)
+        if self.eventos_prestamos:
+            nombres.add('prestamos')
+        nombres.update(nombre for nombre in COLECCIONES if getattr(self, nombre).cambiada)
+        return nombres
+
+    def volver_a_lo_guardado(self, nombres):
+        """Descartar lo no escrito y volver a leer de disco las colecciones indicadas"""
+        self.colecciones_modificadas.clear()
+        self.eventos_prestamos.clear()
+        self.observaciones_pendientes = []
+        self.leer_cambios_externos(releer=nombres)
+
+    def escribir_pendiente(self):
+        """Escribir lo modificado antes de soltar el candado"""
+        if self.colecciones_modificadas or self.eventos_prestamos or self.observaciones_pendientes:
+            self.guardar_datos()
+
+    def migrar_referencias(self):
+        """Pasar los préstamos de versiones anteriores a ids y a una lista de artículos"""
+        for prestamo in self.prestamos:
+            if 'articulos' in prestamo:
+                continue
+            if 'usuario_id' not in prestamo:
+                prestamo['usuario_id'] = self.indice_usuarios.id_de(prestamo.get('usuario'))
+                prestamo['prestamista_id'] = self.indice_prestamistas.id_de(prestamo.get('prestamista'))
+
+            # Un artículo por cada campo equipo/controles/cables/audifonos que estuviera lleno
+            articulos = []
+            for coleccion, campo in CAMPO_PRESTAMO_POR_COLECCION.items():
+                nombre = prestamo.pop(campo, '') or ''
+                item_id = prestamo.pop(campo + '_id', None)
+                if item_id is None and nombre:
+                    # Con nombres repetidos se toma el primero, como se hacía al devolver
+                    item = self.inventario.buscar_nombre(coleccion, nombre)
+                    item_id = item['id'] if item else None
+                if nombre or item_id is not None:
+                    articulos.append({'coleccion': coleccion, 'id': item_id, 'nombre': nombre})
+            prestamo['articulos'] = articulos
+
+            # Se reescribe el archivo completo con el formato nuevo la próxima vez que se guarde
+            self.marcar_modificado('prestamos')
+
+    def nombre_referencia(self, prestamo, campo):
+        """Nombre actual del registro referenciado por el préstamo; el guardado si ya no existe"""
+        registro = getattr(self, COLECCION_POR_CAMPO[campo]).obtener(prestamo.get(campo + '_id'))
+        return registro['nombre'] if registro else prestamo.get(campo, '')
+
+    def nombre_articulo(self, articulo):
+        """Nombre actual de un artículo prestado; el guardado si ya no existe"""
+        item = getattr(self, articulo['coleccion']).obtener(articulo['id'])
+        return item['nombre'] if item else articulo.get('nombre', '')
+
+    def nombres_articulos(self, prestamo, coleccion=None):
+        """Nombres de los artículos del préstamo (de una colección o de todas), separados por comas"""
+        return ", ".join(self.nombre_articulo(a) for a in prestamo.get('articulos', ())
+                         if coleccion is None or a['coleccion'] == coleccion)
+
+    def marcar_modificado(self, coleccion, *ids):
+        """Marcar una colección con cambios por guardar y los registros por refrescar"""
+        self.colecciones_modificadas.add(coleccion)
+        self.cambios_pendientes[coleccion].update(ids)
+
+    def nuevo_id(self, coleccion):
+        """Asignar el siguiente id de una colección"""
+        self.marcar_modificado('secuencias')
+        return getattr(self, coleccion).nuevo_id()
+
+    def registrar_evento(self, tipo, **datos):
+        """Anotar un evento de préstamo (crear, entregar, eliminar) para el diario"""
+        self.eventos_prestamos.append({'tipo': tipo, **datos})
+        prestamo_id = datos['prestamo']['id'] if tipo == 'crear' else datos['id']
+        self.cambios_pendientes['prestamos'].add(prestamo_id)
+
+        # Mantener al día los índices de búsquedas
+        prestamo = self.prestamos.obtener(prestamo_id)
+        if prestamo is None:
+            self.indice_prestamos.quitar(prestamo_id)
+            self.indice_temporal.quitar(prestamo_id)
+        else:
+            self.indice_prestamos.agregar(prestamo)
+            self.indice_temporal.agregar(prestamo)
+
+        if prestamo is None or prestamo['estado'] != 'Prestado':
+            self.vencimientos.quitar(prestamo_id)
+        else:
+            self.vencimientos.agregar(prestamo_id, self.fecha_limite(prestamo))
+
+    def anotar_observaciones(self, observaciones):
+        """Agregar observaciones de entrega a observaciones_finales.json (una escritura para todo el lote)"""
+        obs_path = os.path.join(self.base_dir, 'observaciones_finales.json')
+        if os.path.exists(obs_path):
+            with open(obs_path, 'r', encoding='utf-8') as f:
+                obs_data = json.load(f)
+        else:
+            obs_data = []
+        obs_data.extend(observaciones)
+        with open(obs_path, 'w', encoding='utf-8') as f:
+            json.dump(obs_data, f, ensure_ascii=False, indent=2)
+
+    def guardar_datos(self):
+        """Escribir solo las colecciones modificadas (con el candado tomado); si falla, volver a lo guardado"""
+        lote = {'eventos': [], 'colecciones': {}, 'secuencias': None}
+        observaciones, self.observaciones_pendientes = self.observaciones_pendientes, []
+
+        # Los préstamos se agregan al diario en lugar de reescribir el historial
+        if 'prestamos' not in self.colecciones_modificadas:
+            lote['eventos'] = list(self.eventos_prestamos)
+        self.eventos_prestamos.clear()
+
+        # Los registros compactos se guardan como dict
+        for nombre in COLECCIONES:
+            if nombre in self.colecciones_modificadas:
+                lote['colecciones'][nombre] = [dict(r) for r in getattr(self, nombre)]
+
+        if 'secuencias' in self.colecciones_modificadas:
+            lote['secuencias'] = {n: getattr(self, n).siguiente_id for n in COLECCIONES}
+
+        # Cada colección escrita sube de versión para que las demás estaciones la vuelvan a leer
+        escritas = escritas_en(lote)
+        for nombre in escritas:
+            self.versiones[nombre] = (self.versiones.get(nombre) or 0) + 1
+        lote['versiones'] = dict(self.versiones) if escritas else None
+
+        self.colecciones_modificadas.clear()
+        if observaciones:
+            try:
+                self.anotar_observaciones(observaciones)
+            except (OSError, ValueError) as e:
+                self.volver_a_lo_guardado(escritas)
+                raise ErrorPrestamo(f"No se pudo guardar observaciones: {str(e)}") from e
+        try:
+            escribir_lote(self.almacen, lote)
+        except Exception as e:
+            # Sin reintento: otra estación podría escribir antes; se descarta el cambio en memoria
+            self.volver_a_lo_guardado(escritas)
+            raise ErrorPrestamo(f"No se pudieron guardar los cambios: {str(e)}") from e
+
+        for nombre in COLECCIONES:
+            getattr(self, nombre).cambiada = False
+
+        if lote['eventos'] and self.almacen.requiere_compactacion():
+            self.compactar_diario()
+
+        # Lo recién escrito no es un cambio de otra estación
+        self.firma_archivos = self.instantanea.firma()
+
+    def compactar_diario(self):
+        """Volcar el diario en el archivo de préstamos; si falla se intenta con el siguiente evento"""
+        # Sin marcar registros por refrescar: nada cambia a la vista
+        self.colecciones_modificadas.add('prestamos')
+        try:
+            self.guardar_datos()
+        except ErrorPrestamo:
+            # Los eventos ya quedaron escritos en el diario
+            pass
+
+    def cerrar(self):
+        """Guardar la instantánea para el siguiente arranque"""
+        # Cada transacción escribe todo antes de terminar: los datos en memoria coinciden
+        # con los archivos (salvo que otra estación haya guardado después)
+        try:
+            with self.carpeta_tomada():
+                if self.almacen.cargar_versiones() == self.versiones:
+                    self.instantanea.guardar({a: getattr(self, a) for a in ATRIBUTOS_INSTANTANEA})
+        except Exception:
+            # Solo es un atajo para el arranque: sin ella se leen los archivos
+            pass
+
+    def programar_refresco(self, *vistas):
+        """Avisar qué vistas cambiaron; sin interfaz no hay nada que refrescar"""
+
+    def fecha_limite(self, prestamo):
+        """Fecha límite del préstamo: la indicada o la duración por defecto más corta de lo prestado"""
+        if prestamo.get('fecha_limite'):
+            return prestamo['fecha_limite']
+        duracion = min((DURACION_POR_CATEGORIA.get(CATEGORIA_POR_COLECCION.get(a['coleccion']), DURACION_PRESTAMO)
+                        for a in prestamo.get('articulos', ())),
+                       default=DURACION_PRESTAMO)
+        inicio = datetime.strptime(prestamo['fecha_prestamo'], "%Y-%m-%d %H:%M")
+        return (inicio + duracion).strftime("%Y-%m-%d %H:%M")
+
+    def leer_fecha(self, texto, fin_del_dia=False):
+        """Convertir 'AAAA-MM-DD [HH:MM]' al formato de las fechas guardadas"""
+        texto = (texto or '').strip()
+        if not texto:
+            return None
+        try:
+            return datetime.strptime(texto, "%Y-%m-%d %H:%M").strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            dia = datetime.strptime(texto, "%Y-%m-%d")
+            return dia.strftime("%Y-%m-%d ") + ("23:59" if fin_del_dia else "00:00")
+
+    def actualizar_vencidos(self):
+        """Marcar los préstamos que vencieron desde la última revisión y devolver sus ids"""
+        nuevos = self.vencimientos.vencer(datetime.now().strftime("%Y-%m-%d %H:%M"))
+        if nuevos:
+            self.cambios_pendientes['prestamos'].update(nuevos)
+            self.programar_refresco('prestamos')
+        return nuevos
+
+    def tiene_prestamos_activos(self, campo, valor):
+        """Indica si algún préstamo sin entregar tiene el valor dado en el campo"""
+        # En memoria: se consulta desde la ventana, que no debe esperar al disco
+        return any(self.prestamos.obtener(i).get(campo) == valor
+                   for i in self.indice_prestamos.por_estado.get('Prestado', ()))
+
+    def liberar_equipos(self, prestamo):
+        """Marcar como disponibles los equipos de un préstamo"""
+        for articulo in prestamo.get('articulos', ()):
+            coleccion = articulo['coleccion']
+            item = getattr(self, coleccion).obtener(articulo['id'])
+            if item:
+                self.inventario.marcar(coleccion, item, 'Disponible')
+                self.marcar_modificado(coleccion, item['id'])
+
+    def coleccion(self, nombre, permitidas=COLECCIONES):
+        """Colección por nombre; solo las permitidas"""
+        if nombre not in permitidas:
+            raise NoEncontrado(f"Colección desconocida: {nombre}")
+        return getattr(self, nombre)
+
+    def obtener(self, coleccion, registro_id):
+        """Registro de una colección por id"""
+        registro = self.coleccion(coleccion).obtener(registro_id)
+        if registro is None:
+            raise NoEncontrado(f"No existe el registro {registro_id} en {coleccion}")
+        return registro
+
+    def nueva_persona(self, coleccion, nombre):
+        """Agregar un usuario o prestamista sin guardar todavía"""
+        persona = {
+            'id': self.nuevo_id(coleccion),
+            'nombre': nombre,
+            'tipo': TIPO_POR_COLECCION[coleccion]
+        }
+        getattr(self, coleccion).agregar(persona)
+        getattr(self, f"indice_{coleccion}").agregar(persona)
+        self.marcar_modificado(coleccion, persona['id'])
+        return persona
+
+    @transaccional
+    def alta_persona(self, coleccion, nombre):
+        """Registrar un usuario o prestamista"""
+        self.coleccion(coleccion, TIPO_POR_COLECCION)
+        nombre = (nombre or '').strip()
+        if not nombre:
+            raise ErrorPrestamo(f"Por favor ingrese el nombre del {TIPO_POR_COLECCION[coleccion].lower()}")
+
+        persona = self.nueva_persona(coleccion, nombre)
+        self.programar_refresco('usuarios', 'desplegables')
+        return persona
+
+    @transaccional
+    def baja_persona(self, coleccion, persona_id):
+        """Eliminar un usuario o prestamista sin préstamos activos"""
+        self.coleccion(coleccion, TIPO_POR_COLECCION)
+        persona = self.obtener(coleccion, persona_id)
+        campo = {nombre: campo for campo, nombre in COLECCION_POR_CAMPO.items()}[coleccion]
+        if self.tiene_prestamos_activos(campo + '_id', persona['id']):
+            raise ErrorPrestamo(f"No se puede eliminar el {TIPO_POR_COLECCION[coleccion].lower()} "
+                                f"porque tiene préstamos activos")
+
+        getattr(self, coleccion).eliminar(persona['id'])
+        getattr(self, f"indice_{coleccion}").quitar(persona['id'])
+        self.marcar_modificado(coleccion, persona['id'])
+        self.programar_refresco('usuarios', 'desplegables')
+        return persona
+
+    @transaccional
+    def alta_articulo(self, nombre, categoria):
+        """Agregar un artículo al inventario; devuelve (coleccion, artículo)"""
+        nombre = (nombre or '').strip()
+        categoria = (categoria or '').strip()
+        if not nombre or not categoria:
+            raise ErrorPrestamo("Por favor complete todos los campos")
+
+        # La colección depende de la categoría (por defecto, equipos)
+        coleccion = COLECCION_POR_CATEGORIA.get(categoria, 'equipos')
+        item = Articulo({
+            'id': self.nuevo_id(coleccion),
+            'nombre': nombre,
+            'categoria': categoria,
+            'estado': 'Disponible'
+        })
+        getattr(self, coleccion).agregar(item)
+        self.inventario.agregar(coleccion, item)
+        self.marcar_modificado(coleccion, item['id'])
+        self.programar_refresco('equipos', 'desplegables')
+        return coleccion, item
+
+    @transaccional
+    def baja_articulo(self, coleccion, item_id):
+        """Eliminar un artículo que no esté prestado"""
+        self.coleccion(coleccion, COLECCIONES_INVENTARIO)
+        item = self.obtener(coleccion, item_id)
+        if (coleccion, item['id']) not in self.inventario.disponibles:
+            raise ErrorPrestamo("No se puede eliminar el equipo porque tiene préstamos activos")
+
+        getattr(self, coleccion).eliminar(item['id'])
+        self.inventario.quitar(coleccion, item)
+        self.marcar_modificado(coleccion, item['id'])
+        self.programar_refresco('equipos', 'desplegables')
+        return item
+
+    @transaccional
+    def importar_renglones(self, destino, renglones):
+        """Agregar los renglones {'nombre', 'categoria'} que no existan; guarda y refresca una sola vez
+
+        Los nombres repetidos (ya registrados o dos veces en el archivo) y, en el
+        inventario, los de categoría vacía o desconocida se omiten.
+        Conviene pasar los renglones ya leídos (una lista): mientras dura la
+        importación la carpeta de datos queda tomada.
+        Devuelve (agregados, omitidos).
+        """
+        agregados = defaultdict(list)
+        omitidos = 0
+        for renglon in renglones:
+            nombre = renglon['nombre']
+            if destino == 'inventario':
+                # Categorías conocidas sin importar mayúsculas, acentos ni plural; las demás se omiten
+                categoria = CATEGORIA_POR_TEXTO.get(normalizar(renglon.get('categoria') or ''))
+                coleccion = COLECCION_POR_CATEGORIA.get(categoria)
+                repetido = (coleccion, nombre) in self.inventario.por_nombre
+            else:
+                categoria = True
+                coleccion = destino
+                repetido = getattr(self, f"indice_{coleccion}").contiene(nombre)
+
+            if not nombre or not categoria or repetido:
+                omitidos += 1
+                continue
+
+            if destino == 'inventario':
+                registro = Articulo({'id': self.nuevo_id(coleccion), 'nombre': nombre,
+                                     'categoria': categoria, 'estado': 'Disponible'})
+                self.inventario.agregar(coleccion, registro)
+                getattr(self, coleccion).agregar(registro)
+            else:
+                registro = {'id': self.nuevo_id(coleccion), 'nombre': nombre,
+                            'tipo': TIPO_POR_COLECCION[coleccion]}
+                getattr(self, f"indice_{coleccion}").agregar(registro)
+                getattr(self, coleccion).agregar(registro)
+            agregados[coleccion].append(registro['id'])
+
+        if agregados:
+            for coleccion, ids in agregados.items():
+                self.marcar_modificado(coleccion, *ids)
+
+            # Actualizar interfaces (una sola vez)
+            self.programar_refresco('equipos' if destino == 'inventario' else 'usuarios', 'desplegables')
+
+        return sum(map(len, agregados.values())), omitidos
+
+    @transaccional
+    def prestar(self, usuario, prestamista, articulos, estado_equipo='Completo', observaciones='',
+                fecha_limite=None):
+        """Registrar un préstamo de los artículos [(coleccion, id)]
+
+        Los usuarios y prestamistas que no existan se agregan. Sin fecha límite se
+        usa la duración por defecto de lo prestado.
+        """
+        # Verificar que al menos se haya seleccionado un equipo
+        seleccion = []
+        for coleccion, item_id in articulos:
+            self.coleccion(coleccion, COLECCIONES_INVENTARIO)
+            item = self.obtener(coleccion, item_id)
+            if any(i is item for _, i in seleccion):
+                raise ErrorPrestamo(f"'{item['nombre']}' ya está en el préstamo")
+            seleccion.append((coleccion, item))
+        if not seleccion:
+            raise ErrorPrestamo("Debe seleccionar al menos un equipo")
+
+        # Disponibilidad de todo el conjunto en una sola pasada
+        ocupados = self.inventario.no_disponibles(seleccion)
+        if ocupados:
+            nombres = ", ".join(item['nombre'] for _, item in ocupados)
+            raise ErrorPrestamo(f"No están disponibles: {nombres}")
+
+        # Verificar si el usuario y el prestamista existen, si no, agregarlos
+        usuario = (usuario or '').strip()
+        prestamista = (prestamista or '').strip()
+        if not self.indice_usuarios.contiene(usuario):
+            self.nueva_persona('usuarios', usuario)
+        if not self.indice_prestamistas.contiene(prestamista):
+            self.nueva_persona('prestamistas', prestamista)
+
+        # Crear nuevo préstamo con todos los equipos seleccionados
+        prestamo = Prestamo({
+            'id': self.nuevo_id('prestamos'),
+            'usuario': usuario,
+            'prestamista': prestamista,
+            'usuario_id': self.indice_usuarios.id_de(usuario),
+            'prestamista_id': self.indice_prestamistas.id_de(prestamista),
+            'articulos': [{'coleccion': coleccion, 'id': item['id'], 'nombre': item['nombre']}
+                          for coleccion, item in seleccion],
+            'estado_equipo': estado_equipo,
+            'fecha_prestamo': datetime.now().strftime("%Y-%m-%d %H:%M"),
+            'fecha_entrega': None,
+            'quien_recibe': '',
+            'estado': 'Prestado',
+            'observaciones': observaciones or ''
+        })
+        prestamo['fecha_limite'] = fecha_limite or self.fecha_limite(prestamo)
+
+        # Agregar préstamo
+        self.prestamos.agregar(prestamo)
+        self.registrar_evento('crear', prestamo=dict(prestamo))
+
+        # Todos los artículos pasan a Prestado a la vez, en el mismo guardado
+        for coleccion, item in seleccion:
+            self.inventario.marcar(coleccion, item, 'Prestado')
+            self.marcar_modificado(coleccion, item['id'])
+
+        # Incluye usuarios por si se agregaron automáticamente
+        self.programar_refresco('prestamos', 'equipos', 'usuarios', 'desplegables')
+        return prestamo
+
+    @transaccional
+    def entregar(self, ids, quien_recibe, estado_equipo_entrega='Completo', observaciones=''):
+        """Marcar como entregados los préstamos pendientes de la lista; devuelve los entregados
+
+        Todo el lote se guarda de una vez. Las observaciones solo cuentan si la
+        entrega es Incompleta.
+        """
+        quien_recibe = (quien_recibe or '').strip()
+        if not quien_recibe:
+            raise ErrorPrestamo("Por favor especifique quién recibe el equipo")
+
+        # Solo los préstamos que siguen pendientes
+        prestamos = [p for p in map(self.prestamos.obtener, ids) if p and p['estado'] == 'Prestado']
+        if not prestamos:
+            raise ErrorPrestamo("Este equipo ya fue marcado como entregado")
+
+        fecha_entrega = datetime.now().strftime("%Y-%m-%d %H:%M")
+        observaciones = (observaciones or '').strip() if estado_equipo_entrega == "Incompleto" else ""
+        if observaciones:
+            # Van a observaciones_finales.json junto con el resto del lote
+            self.observaciones_pendientes.extend({
+                'prestamo_id': prestamo['id'],
+                'fecha': fecha_entrega,
+                'observaciones': observaciones
+            } for prestamo in prestamos)
+
+        # Actualizar préstamos y liberar sus equipos en una sola pasada
+        for prestamo in prestamos:
+            prestamo['fecha_entrega'] = fecha_entrega
+            prestamo['quien_recibe'] = quien_recibe
+            prestamo['estado'] = 'Entregado'
+            prestamo['estado_equipo_entrega'] = estado_equipo_entrega
+            if observaciones:
+                prestamo['observaciones_finales'] = observaciones
+            self.registrar_evento('entregar', id=prestamo['id'], campos={
+                campo: prestamo[campo]
+                for campo in ('fecha_entrega', 'quien_recibe', 'estado',
+                              'estado_equipo_entrega', 'observaciones_finales')
+                if campo in prestamo
+            })
+            self.liberar_equipos(prestamo)
+
+        self.programar_refresco('prestamos', 'equipos', 'desplegables')
+        return prestamos
+
+    @transaccional
+    def baja_prestamo(self, prestamo_id):
+        """Eliminar un préstamo; si sigue activo, sus equipos quedan disponibles"""
+        prestamo = self.obtener('prestamos', prestamo_id)
+        if prestamo['estado'] == 'Prestado':
+            self.liberar_equipos(prestamo)
+
+        self.prestamos.eliminar(prestamo['id'])
+        self.registrar_evento('eliminar', id=prestamo['id'])
+        self.programar_refresco('prestamos', 'equipos', 'desplegables')
+        return prestamo
+
+    def buscar(self, texto='', tipo='Todos', estado='Todos', campo_fecha='Préstamo', desde=None, hasta=None):
+        """Préstamos que cumplen texto, estado y rango de fechas ('AAAA-MM-DD [HH:MM]')"""
+        try:
+            desde = self.leer_fecha(desde)
+            hasta = self.leer_fecha(hasta, fin_del_dia=True)
+        except ValueError:
+            raise ErrorPrestamo("Las fechas deben tener el formato AAAA-MM-DD") from None
+
+        ids = self.indice_prestamos.consultar(
+            texto=texto or '',
+            campos=CAMPOS_POR_TIPO_BUSQUEDA.get(tipo, CAMPOS_TEXTO_PRESTAMO),
+            estado=None if estado == 'Todos' else estado,
+            campo_fecha='fecha_entrega' if campo_fecha == 'Entrega' else 'fecha_prestamo',
+            desde=desde,
+            hasta=hasta)
+
+        if ids is None:
+            # Sin filtros: todos los préstamos
+            return list(self.prestamos)
+        return [self.prestamos.obtener(i) for i in ids]
+
+    def vigentes(self, desde, hasta=None):
+        """Préstamos que estaban fuera en un momento o en algún punto del periodo"""
+        texto_desde = (desde or '').strip() or (hasta or '').strip()
+        texto_hasta = (hasta or '').strip() or texto_desde
+        if not texto_desde:
+            raise ErrorPrestamo("Indique una fecha en Desde o Hasta")
+        try:
+            # Solo una fecha: con hora es ese momento, sin hora es el día completo
+            desde = self.leer_fecha(texto_desde)
+            hasta = self.leer_fecha(texto_hasta, fin_del_dia=True)
+        except ValueError:
+            raise ErrorPrestamo("Las fechas deben tener el formato AAAA-MM-DD") from None
+
+        return [self.prestamos.obtener(i) for i in self.indice_temporal.vigentes(desde, hasta)]
+
+    def vencidos(self):
+        """Préstamos vencidos, del más atrasado al más reciente"""
+        self.actualizar_vencidos()
+        return sorted((self.prestamos.obtener(i) for i in self.vencimientos.vencidos), key=self.fecha_limite)
@@ -0,0 +1,135 @@
+"""Registros compactos (con __slots__) que se usan como diccionarios"""
+import sys
+
+
+class Registro:
+    """Registro con un slot por campo; los campos ausentes son slots sin asignar
+
+    Se accede como a un dict (registro['campo'], get, in, dict(registro)), así
+    que el resto del programa y la persistencia no notan la diferencia. Los
+    campos que no están en __slots__ se guardan aparte en 'otros'.
+    """
+
+    __slots__ = ('otros',)
+
+    # Campos con pocos valores distintos: se comparte una sola copia de cada texto
+    INTERNADOS = frozenset()
+
+    def __init_subclass__(cls):
+        cls.CAMPOS = frozenset(cls.__slots__)
+
+    def __init__(self, datos=()):
+        self.otros = None
+        for campo, valor in dict(datos).items():
+            self[campo] = valor
+
+    def __getitem__(self, campo):
+        if campo in self.CAMPOS:
+            try:
+                return getattr(self, campo)
+            except AttributeError:
+                raise KeyError(campo) from None
+        if self.otros is None:
+            raise KeyError(campo)
+        return self.otros[campo]
+
+    def __setitem__(self, campo, valor):
+        if campo in self.CAMPOS:
+            if campo in self.INTERNADOS and type(valor) is str:
+                valor = sys.intern(valor)
+            setattr(self, campo, valor)
+        else:
+            if self.otros is None:
+                self.otros = {}
+            self.otros[campo] = valor
+
+    def __contains__(self, campo):
+        if campo in self.CAMPOS:
+            return hasattr(self, campo)
+        return self.otros is not None and campo in self.otros
+
+    def get(self, campo, defecto=None):
+        """Valor de un campo, o defecto si no está"""
+        if campo in self.CAMPOS:
+            return getattr(self, campo, defecto)
+        return self.otros.get(campo, defecto) if self.otros else defecto
+
+    def keys(self):
+        """Campos presentes, en el orden de __slots__ y luego los demás"""
+        campos = [campo for campo in self.__slots__ if hasattr(self, campo)]
+        if self.otros:
+            campos.extend(self.otros)
+        return campos
+
+    def items(self):
+        """Pares (campo, valor) de los campos presentes"""
+        return [(campo, self[campo]) for campo in self.keys()]
+
+    def __delitem__(self, campo):
+        if campo in self.CAMPOS:
+            try:
+                delattr(self, campo)
+            except AttributeError:
+                raise KeyError(campo) from None
+        elif self.otros is not None:
+            del self.otros[campo]
+        else:
+            raise KeyError(campo)
+
+    def pop(self, campo, *defecto):
+        """Quitar un campo y devolver su valor"""
+        try:
+            valor = self[campo]
+        except KeyError:
+            if defecto:
+                return defecto[0]
+            raise
+        del self[campo]
+        return valor
+
+    def update(self, datos):
+        """Asignar varios campos a la vez"""
+        for campo, valor in dict(datos).items():
+            self[campo] = valor
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class Prestamo(Registro):
+    """Préstamo; usuario_id, prestamista_id y articulos referencian a los demás registros
+
+    articulos es una lista de {'coleccion', 'id', 'nombre'}. Los nombres se
+    conservan como quedaron al prestar, para el historial y por si el registro
+    referenciado se elimina.
+    """
+
+    __slots__ = ('id', 'usuario', 'prestamista', 'usuario_id', 'prestamista_id', 'articulos',
+                 'estado_equipo', 'fecha_prestamo', 'fecha_entrega', 'quien_recibe', 'estado',
+                 'observaciones', 'fecha_limite', 'estado_equipo_entrega', 'observaciones_finales')
+
+    INTERNADOS = frozenset(('usuario', 'prestamista', 'estado_equipo', 'quien_recibe', 'estado'))
+
+
+class Articulo(Registro):
+    """Artículo del inventario (equipo, control, cable o audífonos)"""
+
+    __slots__ = ('id', 'nombre', 'categoria', 'estado')
+
+    INTERNADOS = frozenset(('nombre', 'categoria', 'estado'))
+
+
+# Clase de registro de cada colección (usuarios y prestamistas siguen como dict)
+CLASE_POR_COLECCION = {
+    'prestamos': Prestamo,
+    'equipos': Articulo,
+    'controles': Articulo,
+    'cables': Articulo,
+    'audifonos': Articulo,
+}
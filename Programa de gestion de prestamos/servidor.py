@@ -0,0 +1,176 @@
+"""Servidor HTTP/JSON local sobre el motor de préstamos
+
+Un solo proceso es dueño de los archivos de datos; las estaciones del mostrador
+y los scripts le hablan por HTTP en lugar de abrir cada uno su copia.
+
+Uso: python servidor.py [puerto] [host]
+
+Rutas (los cuerpos y las respuestas son JSON):
+    GET    /prestamos?texto=&tipo=&estado=&campo_fecha=&desde=&hasta=
+    GET    /prestamos/vencidos
+    GET    /prestamos/vigentes?desde=&hasta=
+    GET    /prestamos/<id>
+    POST   /prestamos            {usuario, prestamista, articulos: [{coleccion, id}],
+                                  estado_equipo, observaciones, fecha_limite}
+    POST   /prestamos/entregar   {ids, quien_recibe, estado_equipo_entrega, observaciones}
+    DELETE /prestamos/<id>
+    GET    /<coleccion>[?disponibles=1]   usuarios, prestamistas, equipos, controles, cables, audifonos
+    GET    /<coleccion>/<id>
+    POST   /usuarios | /prestamistas      {nombre}
+    POST   /inventario                    {nombre, categoria}
+    DELETE /<coleccion>/<id>
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from motor import (COLECCIONES_INVENTARIO, TIPO_POR_COLECCION, DatosOcupados, ErrorPrestamo, MotorPrestamos,
+                   NoEncontrado)
+from persistencia import COLECCIONES
+
+# Solo se escucha en la propia máquina salvo que se indique otro host
+HOST = '127.0.0.1'
+PUERTO = 8765
+
+# Tamaño máximo (bytes) del cuerpo de una petición
+MAXIMO_CUERPO = 1024 * 1024
+
+
+class ManejadorPrestamos(BaseHTTPRequestHandler):
+    """Traduce cada petición a una llamada al motor; una sola llamada a la vez"""
+
+    server_version = 'GestionPrestamos/1.0'
+
+    def do_GET(self):
+        self.atender('GET')
+
+    def do_POST(self):
+        self.atender('POST')
+
+    def do_DELETE(self):
+        self.atender('DELETE')
+
+    def atender(self, metodo):
+        """Ejecutar la ruta pedida y responder con JSON"""
+        ruta = urlsplit(self.path)
+        partes = [parte for parte in ruta.path.split('/') if parte]
+        consulta = {clave: valores[-1] for clave, valores in parse_qs(ruta.query).items()}
+        try:
+            cuerpo = self.leer_cuerpo() if metodo == 'POST' else {}
+            # El motor no es seguro entre hilos: las peticiones se atienden de una en una
+            with self.server.candado:
+                # Las consultas también deben ver lo que guardaron las estaciones con la carpeta compartida
+                if metodo == 'GET':
+                    self.server.motor.revisar_archivos()
+                estado, respuesta = self.despachar(metodo, partes, consulta, cuerpo)
+        except NoEncontrado as e:
+            estado, respuesta = 404, {'error': str(e)}
+        except DatosOcupados as e:
+            estado, respuesta = 503, {'error': str(e)}
+        except ErrorPrestamo as e:
+            estado, respuesta = 400, {'error': str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            estado, respuesta = 400, {'error': f"Petición inválida: {str(e)}"}
+        except Exception as e:
+            self.log_error("Error al atender %s %s: %r", metodo, self.path, e)
+            estado, respuesta = 500, {'error': str(e)}
+        self.responder(estado, respuesta)
+
+    def leer_cuerpo(self):
+        """Cuerpo JSON de la petición (un objeto)"""
+        largo = int(self.headers.get('Content-Length') or 0)
+        if largo > MAXIMO_CUERPO:
+            raise ValueError("cuerpo demasiado grande")
+        cuerpo = json.loads(self.rfile.read(largo) or b'{}')
+        if not isinstance(cuerpo, dict):
+            raise ValueError("se esperaba un objeto JSON")
+        return cuerpo
+
+    def responder(self, estado, respuesta):
+        """Enviar la respuesta como JSON"""
+        datos = json.dumps(respuesta, ensure_ascii=False, default=dict).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def despachar(self, metodo, partes, consulta, cuerpo):
+        """(estado HTTP, respuesta) de la ruta pedida"""
+        motor = self.server.motor
+        if not partes:
+            raise NoEncontrado("Ruta no encontrada")
+        recurso, resto = partes[0], partes[1:]
+
+        if recurso == 'prestamos':
+            if metodo == 'GET' and not resto:
+                return 200, motor.buscar(**{campo: consulta[campo] for campo in
+                                            ('texto', 'tipo', 'estado', 'campo_fecha', 'desde', 'hasta')
+                                            if campo in consulta})
+            if metodo == 'GET' and resto == ['vencidos']:
+                return 200, motor.vencidos()
+            if metodo == 'GET' and resto == ['vigentes']:
+                return 200, motor.vigentes(consulta.get('desde'), consulta.get('hasta'))
+            if metodo == 'POST' and not resto:
+                articulos = [(articulo['coleccion'], int(articulo['id'])) for articulo in cuerpo['articulos']]
+                prestamo = motor.prestar(cuerpo.get('usuario'), cuerpo.get('prestamista'), articulos,
+                                         estado_equipo=cuerpo.get('estado_equipo', 'Completo'),
+                                         observaciones=cuerpo.get('observaciones', ''),
+                                         fecha_limite=motor.leer_fecha(cuerpo.get('fecha_limite'), fin_del_dia=True))
+                return 201, prestamo
+            if metodo == 'POST' and resto == ['entregar']:
+                return 200, motor.entregar([int(i) for i in cuerpo['ids']], cuerpo.get('quien_recibe'),
+                                           cuerpo.get('estado_equipo_entrega', 'Completo'),
+                                           cuerpo.get('observaciones', ''))
+            if len(resto) == 1 and metodo == 'GET':
+                return 200, motor.obtener('prestamos', int(resto[0]))
+            if len(resto) == 1 and metodo == 'DELETE':
+                return 200, motor.baja_prestamo(int(resto[0]))
+
+        elif recurso == 'inventario' and metodo == 'POST' and not resto:
+            coleccion, item = motor.alta_articulo(cuerpo.get('nombre'), cuerpo.get('categoria'))
+            return 201, {'coleccion': coleccion, **item}
+
+        elif recurso in COLECCIONES and recurso != 'prestamos':
+            if metodo == 'GET' and not resto:
+                registros = motor.coleccion(recurso)
+                if consulta.get('disponibles') and recurso in COLECCIONES_INVENTARIO:
+                    return 200, [r for r in registros if (recurso, r['id']) in motor.inventario.disponibles]
+                return 200, list(registros)
+            if metodo == 'POST' and not resto and recurso in TIPO_POR_COLECCION:
+                return 201, motor.alta_persona(recurso, cuerpo.get('nombre'))
+            if len(resto) == 1 and metodo == 'GET':
+                return 200, motor.obtener(recurso, int(resto[0]))
+            if len(resto) == 1 and metodo == 'DELETE':
+                if recurso in TIPO_POR_COLECCION:
+                    return 200, motor.baja_persona(recurso, int(resto[0]))
+                return 200, motor.baja_articulo(recurso, int(resto[0]))
+
+        raise NoEncontrado("Ruta no encontrada")
+
+
+def crear_servidor(motor, host=HOST, puerto=PUERTO):
+    """Servidor HTTP con un hilo por conexión sobre un motor ya cargado"""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorPrestamos)
+    servidor.motor = motor
+    servidor.candado = threading.Lock()
+    return servidor
+
+
+if __name__ == '__main__':
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else PUERTO
+    host = sys.argv[2] if len(sys.argv) > 2 else HOST
+    motor = MotorPrestamos(os.path.dirname(os.path.abspath(__file__)))
+    servidor = crear_servidor(motor, host, puerto)
+    print(f"Atendiendo en http://{host}:{puerto} (Ctrl+C para terminar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        # Instantánea para el siguiente arranque
+        motor.cerrar()